@@ -0,0 +1,28 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.template import Engine
+
+from .flattening import SOURCE_HASH_FILE, source_directories, source_hash
+
+
+@register(Tags.templates)
+def check_flat_templates(app_configs, **kwargs):
+    """Fail when the flattened templates in use are missing or were built
+    from other sources than the current ones."""
+    engine = Engine.get_default()
+    build = os.path.abspath(settings.FLAT_TEMPLATES_DIR)
+    if build not in map(os.path.abspath, engine.dirs):
+        return []
+    hint = 'Запустите manage.py flatten_templates.'
+    try:
+        with open(os.path.join(build, SOURCE_HASH_FILE)) as file:
+            built_from = file.read().strip()
+    except FileNotFoundError:
+        return [Error(f'Шаблоны в {build} не собраны.',
+                      hint=hint, id='core.E001')]
+    if built_from != source_hash(source_directories(engine, build)):
+        return [Error(f'Шаблоны в {build} собраны из старых исходников.',
+                      hint=hint, id='core.E002')]
+    return []
@@ -0,0 +1,141 @@
+"""Inlining static ``{% include %}`` tags into the including template.
+
+An include is resolved, parsed and rendered with a context push every
+time it renders, once per loop iteration inside a ``{% for %}``. A
+flattened template carries the included source in place of the tag, so
+it is parsed once and rendered as part of its parent.
+
+Only includes of a quoted template name are inlined. Includes with
+``only``, with the legacy ``with ... as ...`` syntax, or of a template
+that extends another or defines blocks are left as they are, since
+their meaning would change. ``with`` arguments become a ``{% with %}``
+around the inlined source. Variables an inlined template assigns with
+``as`` outside a block tag are visible to the rest of the parent.
+"""
+import hashlib
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.template import Engine, TemplateDoesNotExist, TemplateSyntaxError
+from django.template.base import DebugLexer, TokenType
+from django.template.utils import get_app_template_dirs
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+# Written next to the flattened templates; holds the source_hash() they
+# were built from.
+SOURCE_HASH_FILE = '.source-hash'
+
+
+class TemplateFlattener:
+    """Flatten templates as found by the loaders of ``engine``."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.inlined = 0
+        self._sources = {}
+
+    def get_source(self, name: str) -> str:
+        """Return the source of the template ``name`` as the engine finds
+        it."""
+        if name not in self._sources:
+            self._sources[name] = self._read(name)
+        return self._sources[name]
+
+    def _read(self, name: str) -> str:
+        for loader in self.engine.template_loaders:
+            for origin in loader.get_template_sources(name):
+                try:
+                    return loader.get_contents(origin)
+                except TemplateDoesNotExist:
+                    continue
+        raise TemplateDoesNotExist(name)
+
+    def flatten(self, name: str, parents: Tuple[str, ...] = ()) -> str:
+        """Return the source of ``name`` with static includes inlined."""
+        if name in parents:
+            raise TemplateSyntaxError(
+                f'Recursive include of {name!r} from {parents[-1]!r}')
+        source = self.get_source(name)
+        chunks = []
+        upto = 0
+        for start, end, included, arguments in self._includes(source):
+            chunks.append(source[upto:start])
+            inlined = self.flatten(included, parents + (name,))
+            if arguments:
+                inlined = (f'{{% with {" ".join(arguments)} %}}'
+                           f'{inlined}{{% endwith %}}')
+            chunks.append(inlined)
+            self.inlined += 1
+            upto = end
+        chunks.append(source[upto:])
+        return ''.join(chunks)
+
+    def _includes(self, source: str) -> Iterator[
+            Tuple[int, int, str, List[str]]]:
+        """Yield the position, template name and ``with`` arguments of
+        every include that can be inlined."""
+        for token in DebugLexer(source).tokenize():
+            if token.token_type != TokenType.BLOCK:
+                continue
+            bits = token.split_contents()
+            if bits[:1] != ['include'] or len(bits) < 2:
+                continue
+            included = _literal(bits[1])
+            options = bits[2:]
+            arguments = options[1:]
+            if (included is None or options and options[0] != 'with'
+                    or not all('=' in bit for bit in arguments)
+                    or not self._inlinable(included)):
+                continue
+            start, end = token.position
+            yield start, end, included, arguments
+
+    def _inlinable(self, name: str) -> bool:
+        try:
+            source = self.get_source(name)
+        except TemplateDoesNotExist:
+            return False
+        return not any(
+            token.token_type == TokenType.BLOCK
+            and token.split_contents()[:1] in (['extends'], ['block'])
+            for token in DebugLexer(source).tokenize()
+        )
+
+
+def _literal(bit: str) -> Optional[str]:
+    if len(bit) > 1 and bit[0] == bit[-1] and bit[0] in '"\'':
+        return bit[1:-1]
+    return None
+
+
+def template_names(directory: str) -> Iterable[str]:
+    """Yield the names of the templates stored under ``directory``."""
+    for root, _, files in os.walk(directory):
+        for file_name in sorted(files):
+            if file_name.endswith(TEMPLATE_EXTENSIONS):
+                path = os.path.relpath(os.path.join(root, file_name),
+                                       directory)
+                yield path.replace(os.sep, '/')
+
+
+def source_directories(engine: Engine, build: str) -> List[str]:
+    """Return the template directories of ``engine`` other than
+    ``build``, in lookup order."""
+    build = os.path.abspath(build)
+    directories = [os.path.abspath(directory) for directory in engine.dirs]
+    return [directory for directory in directories if directory != build]
+
+
+def source_hash(directories: Iterable[str]) -> str:
+    """Return a digest of the templates under ``directories`` and the
+    template directories of the installed apps."""
+    digest = hashlib.sha256()
+    for directory in [*directories, *get_app_template_dirs('templates')]:
+        digest.update(b'\0')
+        for name in sorted(template_names(directory)):
+            with open(os.path.join(directory, *name.split('/')),
+                      'rb') as file:
+                content = file.read()
+            digest.update(f'{name}\0{len(content)}\0'.encode())
+            digest.update(content)
+    return digest.hexdigest()
@@ -0,0 +1,86 @@
+"""Jinja2 engine for the hot feed templates.
+
+The ported templates live in ``JINJA2_DIR`` under the same names as
+their Django originals and are picked per view through
+``JINJA2_VIEWS``. The environment provides what those templates load
+from Django tag libraries: ``url``, ``static``, ``page_url``,
+``thumbnail`` and ``post_picture`` globals, and the ``addclass``,
+``date`` and ``truncatechars`` filters.
+"""
+import logging
+
+from django.template import defaultfilters
+from django.template.backends.jinja2 import Jinja2, Template
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.timezone import template_localtime
+from jinja2 import Environment, Undefined, pass_context
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.shortcuts import get_thumbnail
+
+from core.templatetags.pagination import page_url
+from core.templatetags.user_filters import addclass
+from posts.templatetags.post_images import post_picture
+
+from .template_backends import profiled_render
+
+logger = logging.getLogger(__name__)
+
+
+class ProfiledJinja2Template(Template):
+    def render(self, context=None, request=None):
+        return profiled_render(super().render, context, request)
+
+
+class ProfiledJinja2(Jinja2):
+    """Jinja2 templates adding their render time to the request profile."""
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return ProfiledJinja2Template(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledJinja2Template(template.template, self)
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args or None, kwargs=kwargs or None)
+
+
+def thumbnail(file_, geometry, **options):
+    """Return the thumbnail of ``file_`` as sorl's ``{% thumbnail %}``
+    would, or ``None`` when there is no file or it failed."""
+    if not file_:
+        return None
+    try:
+        return get_thumbnail(file_, geometry, **options)
+    except Exception:
+        if sorl_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('Thumbnail of %s failed', file_)
+        return None
+
+
+def date(value, arg=None):
+    # A missing value renders empty, as with Django's filter.
+    if isinstance(value, Undefined):
+        return ''
+    return defaultfilters.date(template_localtime(value), arg)
+
+
+def environment(**options) -> Environment:
+    env = Environment(**options)
+    env.globals.update({
+        'url': url,
+        'static': static,
+        'page_url': pass_context(page_url),
+        'thumbnail': thumbnail,
+        'post_picture': post_picture,
+    })
+    env.filters.update({
+        'addclass': addclass,
+        'date': date,
+        'truncatechars': defaultfilters.truncatechars,
+    })
+    return env
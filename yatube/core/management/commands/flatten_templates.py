@@ -0,0 +1,54 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Engine
+
+from core.flattening import (SOURCE_HASH_FILE, TemplateFlattener,
+                             source_directories, source_hash,
+                             template_names)
+
+
+class Command(BaseCommand):
+    help = ('Собирает шаблоны проекта со встроенными {% include %} в '
+            'FLAT_TEMPLATES_DIR; в продакшене они подменяют исходные.')
+    # The checks fail on a stale build, which this command replaces.
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=settings.FLAT_TEMPLATES_DIR,
+            help='Каталог для собранных шаблонов; очищается перед сборкой.'
+        )
+
+    def handle(self, *args, output, **options):
+        output = os.path.abspath(output)
+        default = Engine.get_default()
+        sources = source_directories(default, settings.FLAT_TEMPLATES_DIR)
+        if any(os.path.commonpath([directory, output]) in (directory, output)
+               for directory in sources):
+            raise CommandError(
+                f'Каталог {output} пересекается с исходными шаблонами.')
+        engine = Engine(dirs=sources, app_dirs=True,
+                        libraries=default.libraries)
+        flattener = TemplateFlattener(engine)
+        if os.path.isdir(output):
+            shutil.rmtree(output)
+        built = 0
+        for directory in sources:
+            for name in template_names(directory):
+                source = flattener.flatten(name)
+                engine.from_string(source)
+                path = os.path.join(output, *name.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(source)
+                built += 1
+        os.makedirs(output, exist_ok=True)
+        with open(os.path.join(output, SOURCE_HASH_FILE), 'w') as file:
+            file.write(source_hash(sources))
+        self.stdout.write(
+            f'Собрано шаблонов: {built}, встроено include: '
+            f'{flattener.inlined}, каталог: {output}')
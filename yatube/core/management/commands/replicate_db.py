@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replicas import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу в реплику раз в --interval секунд, '
+            'заменяя настоящую репликацию при локальной разработке.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Пауза между копированиями, с.'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Скопировать один раз и выйти.'
+        )
+
+    def handle(self, *args, interval, once, **options):
+        if settings.REPLICA_DATABASE is None:
+            raise CommandError(
+                'Реплика не настроена: задайте YATUBE_REPLICA_DB.')
+        source = settings.DATABASES['default']['NAME']
+        target = settings.DATABASES[settings.REPLICA_DATABASE]['NAME']
+        while True:
+            started = time.perf_counter()
+            copy_database(source, target)
+            self.stdout.write(
+                f'Реплика обновлена за '
+                f'{(time.perf_counter() - started) * 1000:.0f} мс',
+                ending='\n' if once else '\r'
+            )
+            if once:
+                return
+            time.sleep(interval)
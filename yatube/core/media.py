@@ -0,0 +1,157 @@
+"""Serving uploaded media in production.
+
+Conditional requests are answered from the file's ``ETag`` and
+modification time. A single byte range is answered with 206 Partial
+Content; other ``Range`` headers get the whole file, as HTTP allows.
+With ``MEDIA_SENDFILE`` set the body is left to the front server
+(``X-Sendfile`` for Apache and lighttpd, ``X-Accel-Redirect`` for
+nginx), which then also handles ranges. Otherwise a whole file goes out
+as a ``FileResponse``, which servers with a ``wsgi.file_wrapper`` send
+with ``sendfile()``. A range is streamed from a bounded reader instead,
+since a file wrapper may send the file to its end.
+"""
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .static import file_etag
+
+RANGE_RE = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.I)
+SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel-redirect': 'X-Accel-Redirect',
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """Readable window of ``length`` bytes of ``file`` from its position."""
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the first and last byte of a single range in ``header``.
+
+    Returns ``None`` for headers to be ignored: malformed ones and sets
+    of several ranges. Raises ``RangeNotSatisfiable`` for a range past
+    the end of a file of ``size`` bytes.
+    """
+    match = RANGE_RE.match(header)
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = int(last) if last else None
+    if last is not None and last < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    if last is None or last >= size:
+        last = size - 1
+    return first, last
+
+
+def range_is_current(request: HttpRequest, etag: str, mtime: int) -> bool:
+    """Tell whether ``If-Range`` still names the file, if sent."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == mtime
+
+
+def offload(full_path: str, path: str, content_type: str) -> HttpResponse:
+    """Return a response leaving the body to the front server."""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_PREFIX + quote(path))
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+def file_response(request: HttpRequest, full_path: str, size: int,
+                  content_type: str, use_range: bool) -> HttpResponse:
+    byte_range = None
+    if use_range and 'HTTP_RANGE' in request.META:
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        first, last = byte_range
+        file.seek(first)
+        response = FileResponse(FileRange(file, last - first + 1),
+                                status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Length'] = last - first + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request: HttpRequest, path: str):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    stat = os.stat(full_path)
+    etag = file_etag(stat)
+    mtime = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=mtime)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        if content_type is None or encoding is not None:
+            content_type = 'application/octet-stream'
+        if settings.MEDIA_SENDFILE in SENDFILE_HEADERS:
+            response = offload(full_path, path, content_type)
+        else:
+            response = file_response(
+                request, full_path, stat.st_size, content_type,
+                range_is_current(request, etag, mtime))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    return response
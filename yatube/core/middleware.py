@@ -0,0 +1,128 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('yatube.requests')
+
+_local = threading.local()
+
+
+class RequestProfile:
+    """Database and template costs of one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self._slowest = []
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += duration
+            statement = (duration, self.queries, sql)
+            if len(self._slowest) < settings.REQUEST_PROFILE_SLOWEST:
+                heapq.heappush(self._slowest, statement)
+            else:
+                heapq.heappushpop(self._slowest, statement)
+
+    @property
+    def slowest(self):
+        """Return ``(seconds, sql)`` of the slowest statements."""
+        return [(duration, sql)
+                for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{self.queries} queries", '
+            f'tpl;dur={self.template_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """Return the profile of the request being handled in this thread."""
+    return getattr(_local, 'profile', None)
+
+
+class RequestProfileMiddleware:
+    """Report the query count and SQL and template time of every request.
+
+    The numbers go to one JSON line of the ``yatube.requests`` logger,
+    together with the slowest statements, and to the ``Server-Timing``
+    header of staff and ``INTERNAL_IPS``; other visitors are not told
+    what the database spends on a page.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = _local.profile = RequestProfile()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - started
+
+        if _sees_timings(request):
+            response['Server-Timing'] = profile.server_timing(total)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'sql_ms': round(profile.sql_time * 1000, 1),
+            'template_ms': round(profile.template_time * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+            'slowest': [
+                {'ms': round(duration * 1000, 1), 'sql': sql}
+                for duration, sql in profile.slowest
+            ],
+        }, ensure_ascii=False))
+        return response
+
+
+def _sees_timings(request) -> bool:
+    user = getattr(request, 'user', None)
+    return (request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+            or user is not None and user.is_staff)
+
+
+class PrimaryPinMiddleware:
+    """Keep a client on the primary database for a while after it writes.
+
+    See ``core.replicas``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (settings.REPLICA_DATABASE is not None
+                and request.method not in ('GET', 'HEAD', 'OPTIONS')):
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
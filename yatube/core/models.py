@@ -9,3 +9,30 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class LoadedValuesMixin:
+    """Remember the field values a model instance was loaded with."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def get_loaded_value(self, field_name):
+        """Return the value the field had when the instance was loaded."""
+        loaded_values = getattr(self, '_loaded_values', {})
+        return loaded_values.get(field_name, getattr(self, field_name))
@@ -0,0 +1,84 @@
+"""Reading the feeds from a replica of the primary database.
+
+Reads made inside ``replica_reads()`` go to ``settings.REPLICA_DATABASE``
+and everything else to ``default``. Views opt in with
+``read_from_replica``. A client that has just written is pinned to the
+primary by ``PrimaryPinMiddleware`` for ``REPLICA_PIN_SECONDS``, so it
+reads its own writes even while the replica lags behind.
+"""
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_local = threading.local()
+
+
+def replica_alias():
+    """Return the replica alias, or ``None`` when reads stay on default.
+
+    A replica pointing at the primary itself, as a test mirror does, is
+    bypassed.
+    """
+    alias = settings.REPLICA_DATABASE
+    if alias is None:
+        return None
+    if (connections[alias].settings_dict['NAME']
+            == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']):
+        return None
+    return alias
+
+
+class PrimaryReplicaRouter:
+    """Route reads inside ``replica_reads()`` to the replica."""
+
+    def db_for_read(self, model, **hints):
+        if getattr(_local, 'replica', False):
+            return replica_alias() or DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema together with the data.
+        return db != settings.REPLICA_DATABASE
+
+
+@contextmanager
+def replica_reads():
+    outer = getattr(_local, 'replica', False)
+    _local.replica = True
+    try:
+        yield
+    finally:
+        _local.replica = outer
+
+
+def read_from_replica(view):
+    """Serve GET and HEAD requests of unpinned clients from the replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or settings.REPLICA_PIN_COOKIE in request.COOKIES):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def copy_database(source: str, target: str) -> None:
+    """Replace the SQLite database ``target`` with a snapshot of ``source``.
+
+    A stand-in for real replication: the online backup API copies a
+    consistent state while ``source`` keeps taking writes.
+    """
+    with closing(sqlite3.connect(source)) as primary, \
+            closing(sqlite3.connect(target)) as replica:
+        primary.backup(replica)
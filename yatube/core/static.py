@@ -0,0 +1,101 @@
+"""Serving collected static files.
+
+A client is sent the Brotli or gzip sibling written by
+``CompressedManifestStaticFilesStorage`` when its ``Accept-Encoding``
+allows it. Hashed names are cached for ``STATIC_MAX_AGE`` seconds as
+immutable; any other name is revalidated on every use.
+"""
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpRequest
+from django.utils._os import safe_join
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+# Content codings of the precompressed siblings, in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Return the quality of every coding listed in ``Accept-Encoding``."""
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        coding = coding.strip().lower()
+        if coding:
+            accepted[coding] = quality
+    return accepted
+
+
+def negotiate_encoding(request: HttpRequest,
+                       path: str) -> Tuple[str, Optional[str]]:
+    """Return the file to send for ``path`` and its content coding.
+
+    The precompressed sibling the client rates highest wins, Brotli over
+    gzip on a tie; without one the file itself is sent.
+    """
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    candidates = []
+    for preference, (coding, suffix) in enumerate(ENCODINGS):
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > 0 and os.path.isfile(path + suffix):
+            candidates.append((-quality, preference, path + suffix, coding))
+    if not candidates:
+        return path, None
+    _, _, path, coding = min(candidates)
+    return path, coding
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+@require_safe
+def serve_static(request: HttpRequest, path: str):
+    if settings.STATIC_ROOT is None:
+        raise Http404
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    sent_path, coding = negotiate_encoding(request, full_path)
+    stat = os.stat(sent_path)
+    etag = file_etag(stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        if content_type is None or encoding is not None:
+            content_type = 'application/octet-stream'
+        response = FileResponse(open(sent_path, 'rb'),
+                                content_type=content_type)
+        if coding is not None:
+            response['Content-Encoding'] = coding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if any(os.path.isfile(full_path + suffix) for _, suffix in ENCODINGS):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    immutable = getattr(staticfiles_storage, 'immutable_names', ())
+    if path in immutable:
+        patch_cache_control(response, public=True, immutable=True,
+                            max_age=settings.STATIC_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
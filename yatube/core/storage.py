@@ -0,0 +1,71 @@
+"""Static files stored for far-future caching.
+
+``collectstatic`` with ``CompressedManifestStaticFilesStorage`` names
+every file after a hash of its content, records the names in the
+``staticfiles.json`` manifest, and writes ``.gz`` and, with the brotli
+package installed, ``.br`` siblings of the files worth compressing.
+``core.static.serve_static`` serves them.
+"""
+import gzip
+from typing import Iterable
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.utils.functional import cached_property
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.json', '.svg', '.ico',
+                           '.txt', '.html', '.xml')
+# Smaller files gain less than the headers cost.
+MIN_COMPRESS_SIZE = 256
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    @property
+    def compressors(self):
+        """Return the file suffix and compressor of every encoding."""
+        compressors = [('.gz', _gzip)]
+        if brotli is not None:
+            compressors.append(('.br', _brotli))
+        return compressors
+
+    @cached_property
+    def immutable_names(self) -> frozenset:
+        """Return the hashed names, whose content never changes."""
+        return frozenset(self.hashed_files.values())
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths)
+        names.update(self.hashed_files.values())
+        self.compress(names)
+
+    def compress(self, names: Iterable[str]) -> None:
+        """Write the compressed siblings of ``names`` worth having."""
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as original:
+                data = original.read()
+            for suffix, compressor in self.compressors:
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                if len(data) < MIN_COMPRESS_SIZE:
+                    continue
+                content = compressor(data)
+                if len(content) < len(data):
+                    self._save(name + suffix, ContentFile(content))
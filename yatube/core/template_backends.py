@@ -0,0 +1,63 @@
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpRequest
+from django.template import engines
+from django.template.backends.django import DjangoTemplates, Template
+from django.template.utils import InvalidTemplateEngineError
+
+from .middleware import current_profile
+
+JINJA2_ENGINE = 'jinja2'
+
+
+def profiled_render(render, context=None, request=None):
+    """Call ``render`` adding its time to the request profile."""
+    profile = current_profile()
+    if profile is None or profile.rendering:
+        return render(context, request)
+    profile.rendering = True
+    started = time.perf_counter()
+    try:
+        return render(context, request)
+    finally:
+        profile.template_time += time.perf_counter() - started
+        profile.rendering = False
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        return profiled_render(super().render, context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """Django templates adding their render time to the request profile.
+
+    Nested renders count once, as part of the outermost one.
+    """
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return ProfiledTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledTemplate(template.template, self)
+
+
+def engine_for(request: HttpRequest) -> Optional[str]:
+    """Return the alias of the engine rendering the page of ``request``.
+
+    Views whose URL names are listed in ``JINJA2_VIEWS`` are rendered by
+    the Jinja2 engine when it is configured. ``None`` stands for the
+    default lookup through all engines, Django templates first.
+    """
+    match = request.resolver_match
+    if match is None or match.view_name not in settings.JINJA2_VIEWS:
+        return None
+    try:
+        engines[JINJA2_ENGINE]
+    except InvalidTemplateEngineError:
+        return None
+    return JINJA2_ENGINE
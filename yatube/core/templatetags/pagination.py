@@ -0,0 +1,21 @@
+from django import template
+
+
+register = template.Library()
+
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+@register.simple_tag(takes_context=True)
+def page_url(context, **params):
+    """Return the query string of another page of the current listing.
+
+    Pagination parameters of the current request are replaced by
+    ``params``, everything else (search terms, filters) is kept.
+    """
+    query = context['request'].GET.copy()
+    for name in PAGE_PARAMS:
+        query.pop(name, None)
+    for name, value in params.items():
+        query[name] = value
+    return '?' + query.urlencode()
@@ -0,0 +1,39 @@
+import logging
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+
+class TestRunner(DiscoverRunner):
+    """Keep the per-request profile lines out of the test output."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        logging.getLogger('yatube.requests').setLevel(logging.WARNING)
+
+
+class QueryBudgetMixin:
+    """``TestCase`` mixin asserting an upper bound on executed queries.
+
+    Writes run inline while the budget is checked, since the queries of
+    the writer thread are not captured.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int, using: str = DEFAULT_DB_ALIAS):
+        with override_settings(WRITE_COALESCING=False), \
+                CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(context.captured_queries, 1)
+            )
+            self.fail(
+                f'{executed} queries executed, the budget is {budget}:\n'
+                f'{queries}'
+            )
@@ -1,6 +1,34 @@
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connections, router
+from django.http import Http404, HttpResponse
+from django.template import Engine, TemplateSyntaxError
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         Client, override_settings)
+from django.urls import reverse
+
+from core.checks import check_flat_templates
+from core.flattening import TemplateFlattener
+from core.media import serve_media
+from core.middleware import RequestProfile
+from core.replicas import copy_database, read_from_replica, replica_reads
+from core.static import serve_static
+from core.storage import brotli
+from core.writes import WriteCoalescer, WriteTimeout, run_write
+from posts.models import Group, Post, User
 
 
 class ViewTests(TestCase):
@@ -12,3 +40,543 @@ class ViewTests(TestCase):
 
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class RequestProfileMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_server_timing_header(self):
+        """Ответ содержит Server-Timing с запросами, шаблонами и итогом."""
+        response = self.client.get('/')
+
+        server_timing = response['Server-Timing']
+        self.assertRegex(server_timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(server_timing, r'tpl;dur=[\d.]+')
+        self.assertRegex(server_timing, r'total;dur=[\d.]+')
+
+    def test_server_timing_for_staff_only(self):
+        """Внешние посетители не видят Server-Timing, а персонал видит."""
+        external = {'REMOTE_ADDR': '203.0.113.5'}
+
+        response = self.client.get('/', **external)
+        self.assertNotIn('Server-Timing', response)
+
+        self.client.force_login(User.objects.create_user(
+            username='staff', is_staff=True))
+        response = self.client.get('/', **external)
+        self.assertIn('Server-Timing', response)
+
+    @override_settings(REQUEST_PROFILE_SLOWEST=1)
+    def test_log_line(self):
+        """О каждом запросе пишется строка JSON с самыми медленными SQL."""
+        with self.assertLogs('yatube.requests', 'INFO') as logs:
+            response = self.client.get('/')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/')
+        self.assertEqual(record['status'], response.status_code)
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(len(record['slowest']), 1)
+        self.assertIn('SELECT', record['slowest'][0]['sql'])
+
+
+@override_settings(REPLICA_DATABASE='test_replica')
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.replica_path = os.path.join(self.directory.name, 'replica.db')
+        databases = mock.patch.dict(connections.databases, {'test_replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': self.replica_path,
+        }})
+        databases.start()
+        self.addCleanup(databases.stop)
+        self.addCleanup(connections.__delitem__, 'test_replica')
+        self.addCleanup(connections['test_replica'].close)
+
+        @read_from_replica
+        def probe(request):
+            return HttpResponse(router.db_for_read(Post))
+
+        self.probe = probe
+        self.factory = RequestFactory()
+
+    def test_reads_inside_replica_reads(self):
+        """Чтения внутри replica_reads идут в реплику, записи — нет."""
+        self.assertEqual(router.db_for_read(Post), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Post), 'test_replica')
+            self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_mirror_is_bypassed(self):
+        """Реплика, совпадающая с основной базой, не используется."""
+        connections.databases['test_replica']['NAME'] = (
+            connections['default'].settings_dict['NAME'])
+
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_read_from_replica(self):
+        """Только GET незакреплённого клиента читает из реплики."""
+        pinned = self.factory.get('/')
+        pinned.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        expected = {
+            self.factory.get('/'): b'test_replica',
+            pinned: b'default',
+            self.factory.post('/'): b'default',
+        }
+        for request, alias in expected.items():
+            with self.subTest(method=request.method):
+                self.assertEqual(self.probe(request).content, alias)
+
+    def test_write_pins_client_to_primary(self):
+        """После записи клиент читает из основной базы."""
+        response = self.client.get(reverse('users:login'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('users:login'))
+
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_copy_database(self):
+        """Копия базы содержит все данные основной."""
+        primary_path = os.path.join(self.directory.name, 'primary.db')
+        with closing(sqlite3.connect(primary_path)) as primary:
+            primary.execute('CREATE TABLE items (name TEXT)')
+            primary.execute("INSERT INTO items VALUES ('copied')")
+            primary.commit()
+
+        copy_database(primary_path, self.replica_path)
+
+        with closing(sqlite3.connect(self.replica_path)) as replica:
+            self.assertEqual(
+                replica.execute('SELECT name FROM items').fetchall(),
+                [('copied',)]
+            )
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_replicate_db_needs_replica(self):
+        """Команда replicate_db требует настроенную реплику."""
+        with self.assertRaises(CommandError):
+            call_command('replicate_db', once=True)
+
+
+class WriteCoalescerTests(TransactionTestCase):
+    def create_group(self, slug):
+        def create():
+            Group.objects.create(title=slug, slug=slug, description='')
+            return threading.current_thread().name
+        return create
+
+    def test_writes_run_on_writer_thread(self):
+        """Записи выполняются в потоке записи и возвращают результат."""
+        coalescer = WriteCoalescer(batch_size=10, batch_wait=0.01)
+
+        futures = [coalescer.submit(self.create_group(f'group-{number}'))
+                   for number in range(5)]
+
+        self.assertEqual({future.result(timeout=5) for future in futures},
+                         {'db-writer'})
+        self.assertEqual(Group.objects.count(), 5)
+
+    def test_failed_write_fails_alone(self):
+        """Ошибка одной записи не откатывает остальные в пачке."""
+        coalescer = WriteCoalescer(batch_size=10, batch_wait=0.2)
+
+        futures = [coalescer.submit(self.create_group(slug))
+                   for slug in ('first', 'first', 'second')]
+
+        self.assertEqual(futures[0].result(timeout=5), 'db-writer')
+        with self.assertRaises(IntegrityError):
+            futures[1].result(timeout=5)
+        self.assertEqual(futures[2].result(timeout=5), 'db-writer')
+        self.assertEqual(
+            set(Group.objects.values_list('slug', flat=True)),
+            {'first', 'second'}
+        )
+
+    def test_writes_are_batched(self):
+        """Записи, пришедшие вместе, коммитятся одной транзакцией."""
+        coalescer = WriteCoalescer(batch_size=10, batch_wait=0.2)
+        commit = mock.patch.object(
+            coalescer, '_commit', wraps=coalescer._commit)
+
+        with commit as commit_mock:
+            futures = [coalescer.submit(self.create_group(f'batch-{number}'))
+                       for number in range(5)]
+            for future in futures:
+                future.result(timeout=5)
+
+        self.assertEqual(commit_mock.call_count, 1)
+
+    def test_writes_count_in_request_profile(self):
+        """Запросы записи попадают в профиль отправившего её запроса."""
+        profile = RequestProfile()
+        coalescer = mock.patch('core.writes.get_coalescer',
+                               return_value=WriteCoalescer(10, 0))
+        submitter = mock.patch('core.writes.current_profile',
+                               return_value=profile)
+
+        with coalescer, submitter, override_settings(
+                WRITE_COALESCING=True, REQUEST_PROFILE_SLOWEST=10):
+            self.assertEqual(run_write(self.create_group('profiled')),
+                             'db-writer')
+
+        self.assertGreater(profile.queries, 0)
+        self.assertTrue(any('INSERT' in sql for _, sql in profile.slowest))
+
+
+class RunWriteTests(TestCase):
+    def test_runs_inline_in_transaction(self):
+        """Внутри открытой транзакции запись выполняется на месте."""
+        self.assertEqual(
+            run_write(lambda: threading.current_thread().name),
+            threading.current_thread().name
+        )
+
+
+@override_settings(WRITE_TIMEOUT=0.05)
+class RunWriteTimeoutTests(TransactionTestCase):
+    def setUp(self):
+        coalescer = mock.patch('core.writes.get_coalescer',
+                               return_value=WriteCoalescer(1, 0))
+        self.coalescer = coalescer.start().return_value
+        self.addCleanup(coalescer.stop)
+
+    def create_group(self):
+        Group.objects.create(title='late', slug='late', description='')
+        return 'created'
+
+    def test_queued_write_is_dropped(self):
+        """Не начатая вовремя запись отменяется и не выполняется."""
+        release = threading.Event()
+        self.coalescer.submit(release.wait)
+
+        with self.assertRaises(WriteTimeout):
+            run_write(self.create_group)
+        release.set()
+        self.coalescer.submit(lambda: None).result(timeout=5)
+
+        self.assertFalse(Group.objects.filter(slug='late').exists())
+
+    def test_started_write_is_waited_for(self):
+        """Уже начатая запись дожидается завершения, а не падает."""
+        def slow_write():
+            time.sleep(0.2)
+            return self.create_group()
+
+        self.assertEqual(run_write(slow_write), 'created')
+        self.assertTrue(Group.objects.filter(slug='late').exists())
+
+
+class TemplateFlattenerTests(TestCase):
+    def flatten(self, templates, name='page.html'):
+        engine = Engine(loaders=[
+            ('django.template.loaders.locmem.Loader', templates)])
+        return TemplateFlattener(engine).flatten(name)
+
+    def test_static_includes_are_inlined(self):
+        """Include с именем в кавычках заменяется текстом шаблона."""
+        source = self.flatten({
+            'page.html': "<p>{% include 'card.html' %}</p>",
+            'card.html': '{% include "name.html" %}!',
+            'name.html': '{{ name }}',
+        })
+
+        self.assertEqual(source, '<p>{{ name }}!</p>')
+
+    def test_with_arguments_become_with_tag(self):
+        """Аргументы with переходят в тег {% with %}."""
+        source = self.flatten({
+            'page.html': "{% include 'card.html' with name=user.name %}",
+            'card.html': '{{ name }}',
+        })
+
+        self.assertEqual(
+            source, '{% with name=user.name %}{{ name }}{% endwith %}')
+
+    def test_dynamic_includes_are_kept(self):
+        """Include, смысл которых изменился бы, остаются на месте."""
+        templates = {
+            'card.html': '{{ name }}',
+            'child.html': "{% extends 'card.html' %}",
+            'blocks.html': '{% block name %}{% endblock %}',
+        }
+        for include in (
+            '{% include template_name %}',
+            "{% include 'card.html' only %}",
+            "{% include 'card.html' with name=user.name only %}",
+            "{% include 'child.html' %}",
+            "{% include 'blocks.html' %}",
+            "{% include 'missing.html' %}",
+        ):
+            with self.subTest(include=include):
+                source = self.flatten({**templates, 'page.html': include})
+                self.assertEqual(source, include)
+
+    def test_recursive_include(self):
+        """Рекурсивный include не уходит в бесконечный цикл."""
+        with self.assertRaises(TemplateSyntaxError):
+            self.flatten({'page.html': "{% include 'page.html' %}"})
+
+    def test_flattened_pages_render_the_same(self):
+        """Страницы из собранных шаблонов совпадают с исходными."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        call_command('flatten_templates', output=directory.name,
+                     stdout=io.StringIO())
+        user = User.objects.create_user(username='flattener')
+        group = Group.objects.create(title='Группа', slug='flat')
+        for number in range(3):
+            Post.objects.create(text=f'Пост {number}', author=user,
+                                group=group)
+        client = Client()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': group.slug}),
+            reverse('posts:profile', kwargs={'username': user.username}),
+        )
+        templates = [{
+            **settings.TEMPLATES[0],
+            'DIRS': [directory.name, settings.TEMPLATES_DIR],
+        }]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                expected = client.get(url)
+                cache.clear()
+                with override_settings(TEMPLATES=templates):
+                    response = client.get(url)
+                self.assertTemplateUsed(expected, 'includes/posts/post.html')
+                self.assertTemplateNotUsed(
+                    response, 'includes/posts/post.html')
+                self.assertEqual(response.content, expected.content)
+
+    def test_stale_build_fails_the_checks(self):
+        """Проверка падает, пока сборка отсутствует или старше исходников."""
+        build = tempfile.TemporaryDirectory()
+        self.addCleanup(build.cleanup)
+        sources = tempfile.TemporaryDirectory()
+        self.addCleanup(sources.cleanup)
+        page = os.path.join(sources.name, 'page.html')
+        with open(page, 'w') as file:
+            file.write('<p>Старая</p>')
+        templates = [{
+            **settings.TEMPLATES[0],
+            'DIRS': [build.name, sources.name],
+        }]
+        with override_settings(TEMPLATES=templates,
+                               FLAT_TEMPLATES_DIR=build.name):
+            errors = check_flat_templates(None)
+            self.assertEqual([error.id for error in errors], ['core.E001'])
+
+            call_command('flatten_templates', output=build.name,
+                         stdout=io.StringIO())
+            self.assertEqual(check_flat_templates(None), [])
+
+            with open(page, 'w') as file:
+                file.write('<p>Новая</p>')
+            errors = check_flat_templates(None)
+            self.assertEqual([error.id for error in errors], ['core.E002'])
+
+        self.assertEqual(check_flat_templates(None), [])
+
+
+class StaticPipelineTests(TestCase):
+    CSS = 'body { background: url("../img/dot.png"); }\n' * 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.TemporaryDirectory()
+        cls.root = tempfile.TemporaryDirectory()
+        for name, content in (('css/site.css', cls.CSS.encode()),
+                              ('img/dot.png', b'\x89PNG' * 100)):
+            path = os.path.join(cls.source.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+        cls.static_settings = override_settings(
+            STATIC_ROOT=cls.root.name,
+            STATICFILES_DIRS=[cls.source.name],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'),
+        )
+        cls.static_settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(cls.root.name, 'staticfiles.json')) as file:
+            cls.paths = json.load(file)['paths']
+        cls.css_url = settings.STATIC_URL + cls.paths['css/site.css']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.static_settings.disable()
+        cls.root.cleanup()
+        cls.source.cleanup()
+        super().tearDownClass()
+
+    def test_collectstatic_writes_hashed_compressed_files(self):
+        """collectstatic пишет файлы с хешем в имени и сжатые копии."""
+        css = os.path.join(self.root.name, self.paths['css/site.css'])
+        self.assertRegex(css, r'site\.[0-9a-f]{12}\.css$')
+        with open(css, 'rb') as file:
+            content = file.read()
+        self.assertIn(self.paths['img/dot.png'].split('/')[-1].encode(),
+                      content)
+        with open(css + '.gz', 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), content)
+        self.assertEqual(os.path.exists(css + '.br'), brotli is not None)
+        png = os.path.join(self.root.name, self.paths['img/dot.png'])
+        self.assertFalse(os.path.exists(png + '.gz'))
+
+    def test_encoding_negotiation(self):
+        """Сжатая копия выбирается по Accept-Encoding клиента."""
+        best = 'gzip' if brotli is None else 'br'
+        for accept, encoding in (
+            ('gzip, deflate, br', best),
+            ('gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('br;q=0, *', 'gzip'),
+            ('', None),
+            ('identity', None),
+        ):
+            with self.subTest(accept=accept):
+                response = self.client.get(
+                    self.css_url, HTTP_ACCEPT_ENCODING=accept)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_cache_headers(self):
+        """Файлы с хешем кешируются навсегда, остальные перепроверяются."""
+        hashed = self.client.get(self.css_url)
+        plain = self.client.get(settings.STATIC_URL + 'css/site.css')
+
+        self.assertEqual(
+            hashed['Cache-Control'],
+            f'public, immutable, max-age={settings.STATIC_MAX_AGE}')
+        self.assertEqual(plain['Cache-Control'], 'public, no-cache')
+        self.assertNotEqual(hashed['ETag'], plain['ETag'])
+
+        revalidated = self.client.get(
+            settings.STATIC_URL + 'css/site.css',
+            HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(revalidated.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_missing_files(self):
+        """Файлы вне STATIC_ROOT и несуществующие не отдаются."""
+        request = RequestFactory().get('/')
+        for path in ('css/missing.css', '../manage.py', 'css/'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    serve_static(request, path)
+
+
+class MediaServingTests(TestCase):
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        os.makedirs(os.path.join(self.root.name, 'posts'))
+        with open(os.path.join(self.root.name, 'posts', 'pic.png'),
+                  'wb') as file:
+            file.write(self.CONTENT)
+        media_settings = override_settings(MEDIA_ROOT=self.root.name,
+                                           MEDIA_SENDFILE=None)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.url = settings.MEDIA_URL + 'posts/pic.png'
+
+    def test_full_file(self):
+        """Файл отдаётся целиком с валидаторами кеша."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        revalidated = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_byte_ranges(self):
+        """Один диапазон байтов отдаётся ответом 206."""
+        size = len(self.CONTENT)
+        for header, first, last in (('bytes=0-99', 0, 99),
+                                    ('bytes=900-', 900, size - 1),
+                                    ('bytes=-50', size - 50, size - 1),
+                                    ('bytes=1000-5000', 1000, size - 1)):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(response['Content-Range'],
+                                 f'bytes {first}-{last}/{size}')
+                self.assertEqual(int(response['Content-Length']),
+                                 last - first + 1)
+                self.assertEqual(b''.join(response.streaming_content),
+                                 self.CONTENT[first:last + 1])
+
+    def test_ignored_and_unsatisfiable_ranges(self):
+        """Неподдерживаемый диапазон даёт весь файл, недостижимый - 416."""
+        for header in ('bytes=0-1,5-6', 'bytes=9-3', 'lines=1-2'):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(b''.join(response.streaming_content),
+                                 self.CONTENT)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'],
+                         f'bytes */{len(self.CONTENT)}')
+
+    def test_if_range(self):
+        """Диапазон устаревшей версии файла заменяется всем файлом."""
+        etag = self.client.get(self.url)['ETag']
+        current = self.client.get(self.url, HTTP_RANGE='bytes=0-9',
+                                  HTTP_IF_RANGE=etag)
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9',
+                                HTTP_IF_RANGE='"stale"')
+        self.assertEqual(current.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(stale.status_code, HTTPStatus.OK)
+
+    def test_offload(self):
+        """Тело ответа можно отдать фронтовому серверу."""
+        full_path = os.path.join(self.root.name, 'posts', 'pic.png')
+        for mode, header, value in (
+            ('x-sendfile', 'X-Sendfile', full_path),
+            ('x-accel-redirect', 'X-Accel-Redirect',
+             settings.MEDIA_ACCEL_PREFIX + 'posts/pic.png'),
+        ):
+            with self.subTest(mode=mode):
+                with override_settings(MEDIA_SENDFILE=mode):
+                    response = self.client.get(self.url)
+                self.assertEqual(response[header], value)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['Content-Type'], 'image/png')
+                self.assertIn('ETag', response)
+
+    def test_head_and_missing_files(self):
+        """HEAD отдаёт заголовки, файлы вне MEDIA_ROOT не отдаются."""
+        response = self.client.head(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            self.client.post(self.url).status_code,
+            HTTPStatus.METHOD_NOT_ALLOWED)
+        request = RequestFactory().get('/')
+        for path in ('posts/missing.png', '../manage.py', 'posts/'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    serve_media(request, path)
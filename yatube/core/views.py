@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render
 
 
@@ -17,5 +18,12 @@ def server_error(request):
     return render(request, 'core/500.html', status=500)
 
 
+def service_unavailable(request):
+    """Tell the client its write was dropped and may be sent again."""
+    response = render(request, 'core/503.html', status=503)
+    response['Retry-After'] = settings.WRITE_RETRY_AFTER
+    return response
+
+
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
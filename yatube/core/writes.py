@@ -0,0 +1,148 @@
+"""Funnelling the site's writes through one database writer thread.
+
+SQLite lets one connection write at a time, and concurrent request
+transactions that need to write end up with "database is locked".
+``run_write`` hands the write to a single writer thread instead. The
+writer commits whatever has queued up within ``WRITE_BATCH_WAIT``
+seconds, up to ``WRITE_BATCH_SIZE`` writes, in one transaction. Every
+write runs in its own savepoint, so a failing write only fails its own
+request. The queries of a write count in the profile of the request
+that submitted it, although they run on the writer's connection.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from contextlib import ExitStack
+from typing import Any, Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .middleware import RequestProfile, current_profile
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[Future, Callable[[], Any], Optional[RequestProfile]]
+
+
+class WriteTimeout(Exception):
+    """The writer did not take a write up in time; it was dropped."""
+
+
+class WriteCoalescer:
+    def __init__(self, batch_size: int, batch_wait: float,
+                 using: str = DEFAULT_DB_ALIAS):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.using = using
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[[], Any],
+               profile: Optional[RequestProfile] = None) -> Future:
+        """Queue ``func`` for the writer and return its future.
+
+        The queries of ``func`` are recorded in ``profile``.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((future, func, profile))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch: List[Job]) -> None:
+        jobs = [job for job in batch
+                if job[0].set_running_or_notify_cancel()]
+        outcomes = []
+        try:
+            with transaction.atomic(using=self.using):
+                for future, func, profile in jobs:
+                    try:
+                        with ExitStack() as stack:
+                            if profile is not None:
+                                stack.enter_context(
+                                    connections[self.using].execute_wrapper(
+                                        profile.record_query))
+                            stack.enter_context(
+                                transaction.atomic(using=self.using))
+                            outcomes.append((future, func(), None))
+                    except Exception as error:
+                        outcomes.append((future, None, error))
+        except Exception as error:
+            logger.exception('Write batch of %d failed', len(jobs))
+            connections[self.using].close()
+            outcomes = [(future, None, error) for future, _, _ in jobs]
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> WriteCoalescer:
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = WriteCoalescer(
+                settings.WRITE_BATCH_SIZE, settings.WRITE_BATCH_WAIT)
+        return _coalescer
+
+
+def run_write(func: Callable[[], Any]) -> Any:
+    """Run ``func`` in a writer transaction and return its result.
+
+    Raises what ``func`` raised, or ``WriteTimeout`` when the writer did
+    not take ``func`` up within ``WRITE_TIMEOUT`` seconds. A write taken
+    up by then is waited for instead, since its batch may still commit
+    it and a retry would write it twice. Inside an open transaction
+    ``func`` runs inline, since the writer could not see the uncommitted
+    state.
+    """
+    if (not settings.WRITE_COALESCING
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+        with transaction.atomic():
+            return func()
+    future = get_coalescer().submit(func, current_profile())
+    try:
+        return future.result(timeout=settings.WRITE_TIMEOUT)
+    except TimeoutError:
+        if future.cancel():
+            raise WriteTimeout from None
+        return future.result()
+
+
+def configure_sqlite(sender, connection, **kwargs) -> None:
+    """Put every new SQLite connection in WAL mode.
+
+    Readers then no longer block the writer or each other, and commits
+    only sync the log.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
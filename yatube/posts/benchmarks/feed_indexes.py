@@ -0,0 +1,205 @@
+"""Query plans and timings of the feed queries before and after 0011.
+
+Runs against a scratch SQLite file, never against the project database::
+
+    cd yatube
+    python -m posts.benchmarks.feed_indexes --posts 2000000
+
+The rows are inserted at ``posts 0010`` and the database is then
+migrated to the latest state. The "before" pass runs with the indexes
+added by ``posts 0011`` dropped, the "after" pass with them restored.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+BEFORE = '0010_renaming_column_pub_date_on_created'
+AFTER = '0011_feed_indexes'
+USERS = 10_000
+GROUPS = 50
+BATCH = 50_000
+FEED_INDEXES = (
+    'posts_post_created_id_idx',
+    'posts_post_author_created_idx',
+    'posts_post_group_created_idx',
+    'posts_comment_post_created_idx',
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='scratch database file; kept if given')
+    parser.add_argument('--posts', type=int, default=2_000_000)
+    parser.add_argument('--comments', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+
+def seed(cursor, posts, comments, rnd):
+    """Fill the tables with skewed authors and groups via raw inserts."""
+    cursor.executemany(
+        'INSERT INTO auth_user (id, password, is_superuser, username, '
+        'first_name, last_name, email, is_staff, is_active, date_joined, '
+        "last_login) VALUES (?, '', 0, ?, '', '', '', 0, 1, "
+        "'2020-01-01 00:00:00', '2020-01-01 00:00:00')",
+        ((i, f'user{i}') for i in range(1, USERS + 1)),
+    )
+    cursor.executemany(
+        'INSERT INTO posts_group (id, title, slug, description) '
+        "VALUES (?, ?, ?, '')",
+        ((i, f'group {i}', f'group-{i}') for i in range(1, GROUPS + 1)),
+    )
+    start = datetime(2020, 1, 1)
+
+    def author():
+        return min(int(rnd.paretovariate(1.2)), USERS)
+
+    def group():
+        if rnd.random() < 0.3:
+            return None
+        return min(int(rnd.paretovariate(1.5)), GROUPS)
+
+    def post_rows():
+        created = start
+        for pk in range(1, posts + 1):
+            created += timedelta(milliseconds=rnd.randint(1, 2000))
+            yield pk, f'post {pk}', str(created), author(), group(), ''
+
+    def comment_rows():
+        for pk in range(1, comments + 1):
+            post = min(int(rnd.paretovariate(1.1)), posts)
+            created = start + timedelta(seconds=pk)
+            yield pk, post, author(), f'comment {pk}', str(created)
+
+    insert_batches(
+        cursor,
+        'INSERT INTO posts_post (id, text, created, author_id, group_id, '
+        'image) VALUES (?, ?, ?, ?, ?, ?)',
+        post_rows(),
+    )
+    insert_batches(
+        cursor,
+        'INSERT INTO posts_comment (id, post_id, author_id, text, created) '
+        'VALUES (?, ?, ?, ?, ?)',
+        comment_rows(),
+    )
+
+
+def insert_batches(cursor, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            cursor.executemany(sql, batch)
+            batch.clear()
+    cursor.executemany(sql, batch)
+
+
+def feed_queries():
+    from posts.models import Comment, Post
+    from posts.utils import KeysetPaginator
+
+    def page(queryset):
+        # Half way down the feed, whatever the size of the seed; --db
+        # may reuse a file seeded with other numbers.
+        paginator = KeysetPaginator(queryset, 10)
+        middle = queryset.order_by('-created', '-id')[queryset.count() // 2]
+        return paginator._ordered().filter(
+            paginator._seek((middle.created, middle.id), 'lt'))[:11]
+
+    posts = Post.objects.select_related('author', 'group')
+    hot_author = 1
+    hot_group = 1
+    hot_post = 1
+    return {
+        'index, first page':
+            posts.order_by('-created', '-id')[:11],
+        'index, deep cursor':
+            page(posts),
+        'group_posts, first page':
+            Post.objects.filter(group_id=hot_group)
+            .order_by('-created', '-id')[:11],
+        'profile, first page':
+            Post.objects.filter(author_id=hot_author)
+            .order_by('-created', '-id')[:11],
+        'post_detail comments':
+            Comment.objects.filter(post_id=hot_post)[:50],
+    }
+
+
+def measure(cursor, queries, repeat):
+    for name, queryset in queries.items():
+        sql, params = queryset.query.get_compiler('default').as_sql()
+        plan = cursor.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f'  {name}: median {statistics.median(timings):.2f} ms, '
+              f'max {max(timings):.2f} ms')
+        for row in plan:
+            print(f'      {row[-1]}')
+
+
+def main():
+    args = parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'feed_indexes.db')
+    fresh = not os.path.exists(path)
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = path
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from posts.models import Comment, Post
+
+    if fresh:
+        call_command('migrate', 'posts', BEFORE, verbosity=0)
+        print(f'Seeding {args.posts} posts and {args.comments} comments '
+              f'into {path}')
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            seed(cursor, args.posts, args.comments, random.Random(args.seed))
+        print(f'  seeded in {time.perf_counter() - started:.1f} s')
+    call_command('migrate', verbosity=0)
+
+    indexes = [
+        (model, index)
+        for model in (Post, Comment)
+        for index in model._meta.indexes
+        if index.name in FEED_INDEXES
+    ]
+    queries = feed_queries()
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        print(f'Before ({BEFORE}):')
+        measure(cursor, queries, args.repeat)
+
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.add_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        print(f'After ({AFTER}):')
+        measure(cursor, queries, args.repeat)
+
+    if not args.db:
+        connection.close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
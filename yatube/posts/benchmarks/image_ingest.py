@@ -0,0 +1,127 @@
+"""Memory peak and time per upload of the post image ingest.
+
+Feeds a synthetic phone photo through the upload path of ``PostForm``::
+
+    cd yatube
+    python -m posts.benchmarks.image_ingest --width 4032 --height 3024
+
+Every pass runs in a fresh child process, so the reported peak resident
+set size belongs to that pass alone. "original" stores the upload as is
+and then decodes it in full, as every thumbnail job used to; "ingest"
+runs ``posts.images.ingest_image``.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+PASSES = ('original', 'ingest')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', choices=PASSES, help=argparse.SUPPRESS)
+    parser.add_argument('--source', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def make_photo(path, width, height):
+    """Write a grainy gradient JPEG with EXIF, like a phone photo."""
+    from PIL import Image
+
+    gradient = Image.linear_gradient('L')
+    photo = Image.merge('RGB', (
+        gradient.resize((width, height)),
+        gradient.rotate(90).resize((width, height)),
+        Image.effect_noise((width, height), 32),
+    ))
+    exif = Image.Exif()
+    exif[0x010F] = 'Benchmark'
+    exif[0x0112] = 6
+    photo.save(path, 'JPEG', quality=95, exif=exif.tobytes())
+
+
+def run_pass(name, source, repeat):
+    import django
+    django.setup()
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+    from posts.images import check_upload, ingest_image
+
+    with open(source, 'rb') as file:
+        content = file.read()
+
+    def original(upload):
+        check_upload(upload)
+        with Image.open(upload) as image:
+            image.load()
+        upload.seek(0)
+        return upload.read()
+
+    def ingest(upload):
+        check_upload(upload)
+        return ingest_image(upload).read()
+
+    run = {'original': original, 'ingest': ingest}[name]
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        upload = SimpleUploadedFile('photo.jpg', content, 'image/jpeg')
+        started = time.perf_counter()
+        stored = run(upload)
+        timings.append((time.perf_counter() - started) * 1000)
+    python_peak = tracemalloc.get_traced_memory()[1]
+    print(json.dumps({
+        'median_ms': statistics.median(timings),
+        'max_ms': max(timings),
+        'stored_bytes': len(stored),
+        'python_peak_bytes': python_peak,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_pass(args.child, args.source, args.repeat)
+        return
+
+    import django
+    django.setup()
+    from django.conf import settings
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'photo.jpg')
+        make_photo(source, args.width, args.height)
+        print(f'Upload: {args.width}x{args.height}, '
+              f'{os.path.getsize(source) / 2 ** 20:.1f} MB; '
+              f'POST_IMAGE_MAX_SIZE={settings.POST_IMAGE_MAX_SIZE}, '
+              f'POST_IMAGE_FORMAT={settings.POST_IMAGE_FORMAT}')
+        for name in PASSES:
+            output = subprocess.run(
+                [sys.executable, '-m', __spec__.name, '--child', name,
+                 '--source', source, '--repeat', str(args.repeat)],
+                check=True, stdout=subprocess.PIPE,
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(f'  {name}: median {result["median_ms"]:.1f} ms, '
+                  f'max {result["max_ms"]:.1f} ms, '
+                  f'stored {result["stored_bytes"] / 2 ** 10:.0f} KB, '
+                  f'peak RSS {result["max_rss_kb"] / 2 ** 10:.0f} MB, '
+                  f'Python peak '
+                  f'{result["python_peak_bytes"] / 2 ** 20:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
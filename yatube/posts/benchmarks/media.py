@@ -0,0 +1,133 @@
+"""Time and bytes of serving one media file per view and request kind.
+
+Serves a scratch ``MEDIA_ROOT`` through a local ``wsgiref`` server, so
+``FileResponse`` goes out through ``wsgi.file_wrapper`` as under a real
+WSGI server, and never touches the project media::
+
+    cd yatube
+    python -m posts.benchmarks.media --size 8 --repeat 50
+
+``django.views.static.serve`` is what ``DEBUG`` used to mount at
+``MEDIA_URL``; ``core.media.serve_media`` is compared with it on a full
+download, a revalidation by the validators of the last response, the
+resumption of a download from its middle, and, with ``MEDIA_SENDFILE``,
+a download left to the front server.
+"""
+import argparse
+import http.client
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+NAME = 'posts/video.bin'
+urlpatterns = []
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=8,
+                        help='file size in MiB')
+    parser.add_argument('--repeat', type=int, default=50)
+    return parser.parse_args()
+
+
+def fetch(port, url, headers):
+    """Return the status, body size and headers of one request."""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        connection.request('GET', url, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        return response.status, len(body), dict(response.getheaders())
+    finally:
+        connection.close()
+
+
+def measure(port, url, headers, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        status, size, _ = fetch(port, url, headers)
+        timings.append((time.perf_counter() - started) * 1000)
+    return status, size, statistics.median(timings)
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp()
+    size = args.size * 1024 * 1024
+
+    from django.conf import settings
+    settings.MEDIA_ROOT = directory
+    settings.ROOT_URLCONF = __name__
+    settings.ALLOWED_HOSTS = ['*']
+
+    import django
+    django.setup()
+    from django.core.wsgi import get_wsgi_application
+    from django.test import override_settings
+    from django.urls import re_path
+    from django.views.static import serve
+
+    from core.media import serve_media
+
+    urlpatterns.extend([
+        re_path(r'^static-serve/(?P<path>.+)$', serve,
+                {'document_root': directory}),
+        re_path(r'^serve-media/(?P<path>.+)$', serve_media),
+    ])
+    os.makedirs(os.path.join(directory, 'posts'))
+    with open(os.path.join(directory, NAME), 'wb') as file:
+        file.write(os.urandom(size))
+
+    # Set up before the loggers are silenced, since it configures them.
+    application = get_wsgi_application()
+    logging.getLogger('yatube.requests').propagate = False
+    logging.getLogger('yatube.requests').handlers = []
+    server = make_server('127.0.0.1', 0, application,
+                         handler_class=QuietHandler)
+    port = server.server_port
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for view in ('static-serve', 'serve-media'):
+            url = f'/{view}/{NAME}'
+            _, _, last = fetch(port, url, {})
+            validators = {'If-Modified-Since': last['Last-Modified']}
+            if 'ETag' in last:
+                validators = {'If-None-Match': last['ETag']}
+            kinds = {
+                'full': {},
+                'revalidate': validators,
+                'resume': {'Range': f'bytes={size // 2}-'},
+            }
+            for kind, headers in kinds.items():
+                status, body, median = measure(
+                    port, url, headers, args.repeat)
+                print(f'{view} {kind}: {status}, {body} bytes, '
+                      f'median {median:.2f} ms')
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            status, body, median = measure(
+                port, f'/serve-media/{NAME}', {}, args.repeat)
+        print(f'serve-media offload: {status}, {body} bytes, '
+              f'median {median:.2f} ms')
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Render time of a 100-post index page per template setup.
+
+Renders the post cards and the page itself, as the index view does on a
+card cache miss, from a scratch SQLite database filled by
+``seed_yatube``, never the project database::
+
+    cd yatube
+    python -m posts.benchmarks.templates --repeat 200
+
+The setups are the ``DEBUG`` one (source templates, no loader cache),
+the cached loader alone, the templates built by ``flatten_templates``
+alone, and both together as in production.
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100,
+                        help='posts on the page')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    return parser.parse_args()
+
+
+def setups(flat_dir):
+    """Return the ``TEMPLATES`` setting of every setup keyed by name."""
+    from django.conf import settings
+
+    loaders = [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]
+    cached = [('django.template.loaders.cached.Loader', loaders)]
+    base = settings.TEMPLATES[0]
+
+    def templates(dirs, loaders):
+        return [{
+            **base,
+            'DIRS': dirs,
+            'OPTIONS': {**base['OPTIONS'], 'loaders': loaders},
+        }]
+
+    return {
+        'source': templates([settings.TEMPLATES_DIR], loaders),
+        'cached': templates([settings.TEMPLATES_DIR], cached),
+        'flattened': templates([flat_dir, settings.TEMPLATES_DIR], loaders),
+        'flattened+cached': templates(
+            [flat_dir, settings.TEMPLATES_DIR], cached),
+    }
+
+
+def render_page(page_obj, request):
+    from django.core.cache import cache
+    from django.template.loader import render_to_string
+    from posts.cache import render_post_cards
+
+    cache.clear()
+    render_post_cards(page_obj, show_author=True, show_group_link=True)
+    return render_to_string(
+        'posts/index.html', {'page_obj': page_obj}, request)
+
+
+def measure(page_obj, request, repeat, warmup):
+    for _ in range(warmup):
+        render_page(page_obj, request)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render_page(page_obj, request)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), statistics.mean(timings)
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp()
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(
+        directory, 'templates.db')
+    settings.MEDIA_ROOT = directory
+
+    import django
+    django.setup()
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.management import call_command
+    from django.test import RequestFactory, override_settings
+    from posts.models import Post
+    from posts.utils import KeysetPaginator
+
+    try:
+        call_command('migrate', verbosity=0)
+        call_command('seed_yatube', users=20, posts=args.posts, comments=0,
+                     stdout=io.StringIO())
+        flat_dir = os.path.join(directory, 'flat')
+        call_command('flatten_templates', output=flat_dir,
+                     stdout=io.StringIO())
+        page_obj = KeysetPaginator(
+            Post.objects.select_related('author', 'group'), args.posts,
+            count=args.posts
+        ).get_page(1)
+        list(page_obj)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        baseline = None
+        for name, templates in setups(flat_dir).items():
+            with override_settings(TEMPLATES=templates):
+                median, mean = measure(
+                    page_obj, request, args.repeat, args.warmup)
+            baseline = baseline or median
+            print(f'{name}: median {median:.2f} ms, mean {mean:.2f} ms, '
+                  f'x{baseline / median:.1f}')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
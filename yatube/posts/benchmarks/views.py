@@ -0,0 +1,241 @@
+"""Latency, queries and allocations of the hot views, against a baseline.
+
+Drives the views through the Django test client on a scratch SQLite
+database filled by ``seed_yatube``, never the project database::
+
+    cd yatube
+    python -m posts.benchmarks.views --save-baseline
+    # ... change something ...
+    python -m posts.benchmarks.views
+
+Every run writes its results to ``--output`` and fails if a view got
+slower at p95 or allocates more by over ``--threshold`` percent, or
+issues more queries than the baseline, counted over every database
+alias. A run without a baseline fails too: timings depend on the
+machine, so the baseline is saved on it from the unchanged tree first.
+Every alias, the replica included, is pointed at the scratch database.
+Writes run on the request thread, with ``WRITE_COALESCING`` off, so
+that the queries of the write views are counted as well.
+
+To compare the template engines, save a baseline and rerun with
+``--jinja2``, which renders every ported view with Jinja2. Pass
+``--cached-loader`` to both runs: Jinja2 keeps compiled templates in its
+environment, so the Django side needs the cached loader that production
+uses for a fair comparison. Single views are switched with
+``YATUBE_JINJA2_VIEWS=posts:index,...``.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+HERE = os.path.dirname(__file__)
+JINJA2_VIEWS = ('posts:index', 'posts:group_posts', 'posts:profile',
+                'posts:post_detail')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='scratch database file; kept if given')
+    parser.add_argument('--users', type=int, default=2_000)
+    parser.add_argument('--posts', type=int, default=50_000)
+    parser.add_argument('--comments', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument(
+        '--output', default=os.path.join(HERE, 'views_results.json'))
+    parser.add_argument(
+        '--baseline', default=os.path.join(HERE, 'views_baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='allowed regression, percent')
+    parser.add_argument('--jinja2', action='store_true',
+                        help='render the ported views with Jinja2')
+    parser.add_argument('--cached-loader', action='store_true',
+                        help='cache loaded Django templates, as in '
+                             'production')
+    return parser.parse_args()
+
+
+def view_requests(client):
+    """Return the benchmarked requests keyed by view name."""
+    from django.db.models import Count
+    from django.urls import reverse
+    from posts.models import AuthorStats, Group, Post
+
+    author = AuthorStats.objects.select_related('author').order_by(
+        '-posts_count').first().author
+    group = Group.objects.annotate(total=Count('posts')).order_by(
+        '-total').first()
+    post = Post.objects.order_by('-comments_count').first()
+    client.force_login(author)
+    counter = iter(range(sys.maxsize))
+
+    return {
+        'index': lambda: client.get(reverse('posts:index')),
+        'group_posts': lambda: client.get(
+            reverse('posts:group_posts', kwargs={'slug': group.slug})),
+        'profile': lambda: client.get(
+            reverse('posts:profile',
+                    kwargs={'username': author.username})),
+        'post_detail': lambda: client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id})),
+        'post_create': lambda: client.post(
+            reverse('posts:post_create'),
+            {'text': f'benchmark post {next(counter)}', 'group': group.id}),
+        'add_comment': lambda: client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            {'text': f'benchmark comment {next(counter)}'}),
+    }
+
+
+def percentile(timings, number):
+    """Return the nearest-rank ``number``-th percentile of ``timings``."""
+    ordered = sorted(timings)
+    rank = max(math.ceil(len(ordered) * number / 100), 1)
+    return round(ordered[rank - 1], 2)
+
+
+def measure(request, repeat, warmup):
+    from django.db import connections
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        request()
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        with contextlib.ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(sum(len(context) for context in contexts))
+        assert response.status_code in (200, 302), response.status_code
+
+    # Tracing slows everything down, so allocations get their own pass.
+    # Restarting it resets the peak.
+    allocations = []
+    for _ in range(max(repeat // 10, 1)):
+        tracemalloc.start()
+        request()
+        allocations.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'queries': max(queries),
+        'peak_alloc_kb': round(statistics.median(allocations) / 1024, 1),
+    }
+
+
+def regressions(results, baseline, threshold):
+    """Return descriptions of the metrics worse than in ``baseline``."""
+    found = []
+    limit = 1 + threshold / 100
+    for view, current in results.items():
+        previous = baseline.get(view)
+        if previous is None:
+            continue
+        for metric in ('p95_ms', 'peak_alloc_kb'):
+            if current[metric] > previous[metric] * limit:
+                found.append(f'{view}: {metric} {previous[metric]} -> '
+                             f'{current[metric]}')
+        if current['queries'] > previous['queries']:
+            found.append(f'{view}: queries {previous["queries"]} -> '
+                         f'{current["queries"]}')
+    return found
+
+
+def configure(args, path):
+    """Point the settings at the scratch database and the chosen
+    template setup."""
+    from django.conf import settings
+
+    for database in settings.DATABASES.values():
+        database['NAME'] = path
+    settings.MEDIA_ROOT = tempfile.mkdtemp()
+    # The writer thread's queries escape CaptureQueriesContext.
+    settings.WRITE_COALESCING = False
+    if args.jinja2:
+        settings.JINJA2_VIEWS = set(JINJA2_VIEWS)
+    if args.cached_loader and settings.DEBUG:
+        # As the settings do without DEBUG.
+        settings.TEMPLATES[0]['OPTIONS']['loaders'] = [
+            ('django.template.loaders.cached.Loader',
+             settings.TEMPLATE_LOADERS),
+        ]
+
+
+def main():
+    args = parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'views.db')
+    fresh = not os.path.exists(path)
+
+    configure(args, path)
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import Client
+
+    logging.getLogger('yatube.requests').propagate = False
+    logging.getLogger('yatube.requests').handlers = []
+    call_command('migrate', verbosity=0)
+    if fresh:
+        print(f'Seeding {args.posts} posts and {args.comments} comments '
+              f'into {path}')
+        call_command(
+            'seed_yatube', users=args.users, posts=args.posts,
+            comments=args.comments, stdout=io.StringIO())
+
+    results = {}
+    for view, request in view_requests(Client()).items():
+        results[view] = measure(request, args.repeat, args.warmup)
+        print(f'  {view}: ' + ', '.join(
+            f'{metric} {value}' for metric, value in results[view].items()))
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    if not args.db:
+        connections.close_all()
+        os.remove(path)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}: run the unchanged tree '
+              f'with --save-baseline first.')
+        sys.exit(2)
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    found = regressions(results, baseline, args.threshold)
+    for line in found:
+        print(f'REGRESSION {line}')
+    if found:
+        sys.exit(1)
+    print(f'No regressions over {args.threshold:g}% against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
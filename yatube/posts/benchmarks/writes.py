@@ -0,0 +1,112 @@
+"""Comment throughput under many concurrent writers, with and without
+the write coalescer.
+
+Every writer thread posts comments through the ``add_comment`` view on a
+scratch SQLite database, never the project one::
+
+    cd yatube
+    python -m posts.benchmarks.writes --writers 32 --comments 50
+
+Each mode reports the comments stored per second and the requests that
+failed, mostly with "database is locked".
+"""
+import argparse
+import collections
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--comments', type=int, default=50,
+                        help='comments per writer')
+    parser.add_argument('--timeout', type=float, default=1,
+                        help='SQLite busy timeout of every connection, s')
+    return parser.parse_args()
+
+
+def writer(user, url, count, errors, barrier):
+    from django.db import connections
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    barrier.wait()
+    for number in range(count):
+        try:
+            client.post(url, {'text': f'stress comment {number}'})
+        except Exception as error:
+            errors[str(error) or type(error).__name__] += 1
+    connections.close_all()
+
+
+def run(mode, users, url, count):
+    from posts.models import Comment
+
+    errors = collections.Counter()
+    barrier = threading.Barrier(len(users) + 1)
+    threads = [
+        threading.Thread(target=writer,
+                         args=(user, url, count, errors, barrier))
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    before = Comment.objects.count()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stored = Comment.objects.count() - before
+    print(f'{mode}: {stored}/{len(users) * count} comments in '
+          f'{elapsed:.1f} s, {stored / elapsed:.0f}/s, '
+          f'{sum(errors.values())} failed')
+    for error, times in errors.most_common():
+        print(f'    {times} x {error}')
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp()
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(
+        directory, 'writes.db')
+    settings.DATABASES['default']['OPTIONS'] = {'timeout': args.timeout}
+    settings.MEDIA_ROOT = directory
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.urls import reverse
+    from posts.models import Post, User
+
+    logging.getLogger('yatube.requests').propagate = False
+    logging.getLogger('yatube.requests').handlers = []
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    logging.getLogger('core.writes').setLevel(logging.CRITICAL)
+    try:
+        call_command('migrate', verbosity=0)
+        call_command('seed_yatube', users=args.writers, posts=100,
+                     comments=0, stdout=io.StringIO())
+        users = list(User.objects.all()[:args.writers])
+        url = reverse('posts:add_comment',
+                      kwargs={'post_id': Post.objects.first().id})
+        for mode, coalescing in (('direct', False), ('coalesced', True)):
+            settings.WRITE_COALESCING = coalescing
+            run(mode, users, url, args.comments)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Helpers for loading many rows at once."""
+import itertools
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List
+
+from django.db import connections, router
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """Let ``bulk_create`` keep the timestamps set on the instances."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False)
+              or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of up to ``size`` consecutive ``items``."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_create_with_ids(model, objs: List) -> List:
+    """``bulk_create`` ``objs`` and set the ids the database gave them.
+
+    Backends that cannot return the ids of a bulk insert read them back:
+    SQLite holds its write lock from the insert until the commit, so in a
+    transaction the newest ``len(objs)`` rows are exactly ``objs``, in
+    order. Other such backends insert one row at a time.
+    """
+    if not objs:
+        return objs
+    connection = connections[router.db_for_write(model)]
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.bulk_create(objs)
+    if connection.vendor != 'sqlite' or not connection.in_atomic_block:
+        for obj in objs:
+            obj.save_base(raw=True, force_insert=True)
+        return objs
+    model.objects.bulk_create(objs)
+    ids = model.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:len(objs)]
+    for obj, pk in zip(objs, reversed(list(ids))):
+        obj.pk = pk
+    return objs
@@ -0,0 +1,281 @@
+import hashlib
+import time
+from calendar import timegm
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+
+from core.template_backends import engine_for
+
+from .models import Group, Post
+from .thumbnails import track_pending
+
+PAGE_PARAMS = ('page', 'after', 'before')
+CARD_TEMPLATE = 'includes/posts/card.html'
+
+
+def index_feed() -> str:
+    return 'index'
+
+
+def group_feed(slug: str) -> str:
+    return f'group:{slug}'
+
+
+def profile_feed(username: str) -> str:
+    return f'profile:{username}'
+
+
+def groups_feed() -> str:
+    return 'groups'
+
+
+# Versions of the rows a post card or page shows besides the post.
+
+def author_card_feed(author_id: int) -> str:
+    return f'author-card:{author_id}'
+
+
+def group_card_feed(group_id: int) -> str:
+    return f'group-card:{group_id}'
+
+
+def comments_feed(post_id: int) -> str:
+    return f'comments:{post_id}'
+
+
+def _version_key(feed: str) -> str:
+    return f'feed-version:{feed}'
+
+
+def _modified_key(feed: str) -> str:
+    return f'feed-modified:{feed}'
+
+
+def _initial_version() -> int:
+    # Start from the clock so that a counter lost to eviction never
+    # repeats a version some cached page was stored under.
+    return int(time.time() * 1000)
+
+
+def get_feed_versions(feeds: Iterable[str]) -> Dict[str, int]:
+    """Return the current version of every feed, starting missing ones."""
+    keys = {_version_key(feed): feed for feed in feeds}
+    stored = cache.get_many(keys)
+    for key in keys.keys() - stored.keys():
+        cache.add(key, _initial_version(), None)
+        stored[key] = cache.get(key)
+    return {feed: stored[key] for key, feed in keys.items()}
+
+
+def get_feed_validators(*feeds: str) -> Tuple[tuple, datetime]:
+    """Return the current versions of ``feeds`` and when they last changed.
+
+    A change time lost to eviction restarts from now, which only costs
+    clients a full response.
+    """
+    versions = get_feed_versions(feeds)
+    keys = [_modified_key(feed) for feed in feeds]
+    stored = cache.get_many(keys)
+    for key in set(keys) - stored.keys():
+        cache.add(key, time.time(), None)
+        stored[key] = cache.get(key)
+    return (tuple(versions[feed] for feed in feeds),
+            datetime.fromtimestamp(max(stored.values()), timezone.utc))
+
+
+def bump_feed_versions(feeds: Iterable[str]) -> None:
+    """Invalidate every cached page built from ``feeds``.
+
+    The bump is repeated once the surrounding transaction commits, so a
+    page rendered from the pre-commit state between the two is not kept.
+    """
+    feeds = set(feeds)
+
+    def bump():
+        cache.set_many(
+            {_modified_key(feed): time.time() for feed in feeds}, None)
+        for feed in feeds:
+            key = _version_key(feed)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, _initial_version(), None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def post_feeds(post: Post, *group_ids: int) -> List[str]:
+    """Return the feeds showing ``post`` and the feeds of ``group_ids``."""
+    slugs = Group.objects.filter(
+        pk__in={post.group_id, *group_ids} - {None}
+    ).values_list('slug', flat=True)
+    return [
+        index_feed(),
+        profile_feed(post.author.username),
+        *(group_feed(slug) for slug in slugs),
+    ]
+
+
+def cache_anonymous_page(feed_for: Callable[..., str]):
+    """Cache the page for anonymous visitors until its feed changes.
+
+    ``feed_for`` is called with the view keyword arguments and returns
+    the feed the page is built from. Pages of every template engine are
+    cached apart. Pages showing a thumbnail placeholder are not cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method != 'GET' or request.user.is_authenticated
+                    or request.GET.keys() - set(PAGE_PARAMS)):
+                return view(request, *args, **kwargs)
+            versions = get_feed_versions([feed_for(**kwargs)])
+            params = [(name, request.GET.get(name)) for name in PAGE_PARAMS]
+            digest = hashlib.md5(repr(
+                (sorted(kwargs.items()), params, sorted(versions.items()),
+                 engine_for(request))
+            ).encode()).hexdigest()
+            key = f'page:{view.__name__}:{digest}'
+            response = cache.get(key)
+            if response is None:
+                with track_pending() as pending:
+                    response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not pending:
+                    cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+Validators = Optional[Tuple[object, datetime]]
+
+
+def conditional_page(validators_for: Callable[..., Validators]):
+    """Answer conditional GETs of the page with 304 Not Modified.
+
+    ``validators_for`` is called with the view keyword arguments and
+    returns a version of everything the page is built from and its last
+    modification time, or ``None`` to always run the view. The ETag also
+    covers the visitor, the query string and the template engine. Only
+    anonymous pages get a
+    Last-Modified, which cannot tell visitors apart, and every page
+    varies on the cookie. Pages showing a thumbnail placeholder get no
+    validators.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            validators = None
+            if request.method in ('GET', 'HEAD'):
+                validators = validators_for(**kwargs)
+            if validators is None:
+                return view(request, *args, **kwargs)
+            version, modified = validators
+            etag = quote_etag(hashlib.md5(repr(
+                (version, request.user.pk, sorted(request.GET.lists()),
+                 engine_for(request))
+            ).encode()).hexdigest())
+            last_modified = None
+            if not request.user.is_authenticated:
+                last_modified = timegm(modified.utctimetuple())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                with track_pending() as pending:
+                    response = view(request, *args, **kwargs)
+                if response.status_code != 200 or pending:
+                    return response
+            response.setdefault('ETag', etag)
+            if last_modified is not None:
+                response.setdefault(
+                    'Last-Modified', http_date(last_modified))
+            patch_vary_headers(response, ['Cookie'])
+            patch_cache_control(
+                response, no_cache=True,
+                private=request.user.is_authenticated)
+            return response
+        return wrapper
+    return decorator
+
+
+def feed_validators(feed_for: Callable[..., str]) -> Callable[..., Validators]:
+    """Build ``conditional_page`` validators from the page's feed."""
+    def validators_for(**kwargs):
+        return get_feed_validators(feed_for(**kwargs))
+    return validators_for
+
+
+def post_validators(post_id: int) -> Validators:
+    """Validate a post page with one query by primary key.
+
+    The post's comments and the rows of its author and group are
+    covered by their feed versions.
+    """
+    row = Post.objects.filter(pk=post_id).values_list(
+        'modified', 'author_id', 'group_id',
+        'author__stats__posts_count').first()
+    if row is None:
+        return None
+    modified, author_id, group_id, _ = row
+    feeds = [comments_feed(post_id), author_card_feed(author_id)]
+    if group_id:
+        feeds.append(group_card_feed(group_id))
+    versions, changed = get_feed_validators(*feeds)
+    return (row, versions), max(modified, changed)
+
+
+def render_post_cards(posts: Iterable[Post], using: Optional[str] = None,
+                      **options: bool) -> None:
+    """Attach the rendered feed card to every post as ``post.card``.
+
+    Cards are cached per post, keyed by its modification time, the
+    versions of its author and group, the template engine ``using`` and
+    the ``options`` passed to the card template. The whole page is
+    fetched with one multi-get and only the misses are rendered, with
+    the image variants of all of them fetched in one query. Cards
+    showing a thumbnail placeholder are not cached.
+    """
+    posts = list(posts)
+    variant = ','.join(name for name, value in sorted(options.items())
+                       if value)
+    versions = get_feed_versions(
+        {author_card_feed(post.author_id) for post in posts}
+        | {group_card_feed(post.group_id) for post in posts
+           if post.group_id}
+    )
+    keys = {
+        post: (f'post-card:{using or "default"}:{variant}:{post.id}:'
+               f'{post.modified.timestamp()}:'
+               f'{versions[author_card_feed(post.author_id)]}:'
+               f'{versions.get(group_card_feed(post.group_id))}')
+        for post in posts
+    }
+    cached = cache.get_many(keys.values())
+    prefetch_related_objects(
+        [post for post, key in keys.items()
+         if key not in cached and post.image],
+        'image_variants'
+    )
+    rendered = {}
+    for post, key in keys.items():
+        card = cached.get(key)
+        if card is None:
+            with track_pending() as pending:
+                card = render_to_string(
+                    CARD_TEMPLATE, {'post': post, **options}, using=using)
+            if not pending:
+                rendered[key] = card
+        post.card = mark_safe(card)
+    cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
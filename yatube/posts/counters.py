@@ -0,0 +1,273 @@
+from typing import Callable, Iterable, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, QuerySet
+from django.utils.text import Truncator
+
+from .models import (AuthorStats, Comment, Follow, Group, GroupStats, Post,
+                     User)
+
+
+def _live_stats(author_id: int) -> dict:
+    return {
+        'posts_count': Post.objects.filter(author_id=author_id).count(),
+        'followers_count': Follow.objects.filter(author_id=author_id).count(),
+    }
+
+
+def _change_stats(author_id: int, field: str, delta: int) -> None:
+    """Shift the author's stored ``field`` total by ``delta``.
+
+    A missing stats row is created from live counts on increments only:
+    on the delete path the author may be going away in the same
+    transaction.
+    """
+    stats = AuthorStats.objects.filter(author_id=author_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    updated = stats.update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        AuthorStats.objects.get_or_create(
+            author_id=author_id, defaults=_live_stats(author_id))
+
+
+def change_posts_count(author_id: int, delta: int) -> None:
+    """Shift the author's stored post total by ``delta``."""
+    _change_stats(author_id, 'posts_count', delta)
+
+
+def change_followers_count(author_id: int, delta: int) -> None:
+    """Shift the author's stored follower total by ``delta``."""
+    _change_stats(author_id, 'followers_count', delta)
+
+
+def change_comments_count(post_id: int, delta: int) -> None:
+    """Shift the post's stored comment total by ``delta``."""
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def _latest_post_fields(group_id: int) -> dict:
+    """Return the ``GroupStats`` fields describing the group's newest post.
+
+    One range scan of the group's feed index.
+    """
+    post = (
+        Post.objects.filter(group_id=group_id)
+        .select_related('author')
+        .only('id', 'created', 'text', 'author__username')
+        .order_by('-created', '-id')
+        .first()
+    )
+    if post is None:
+        return {'last_post': None, 'last_activity': None,
+                'last_post_text': '', 'last_post_author': ''}
+    return {
+        'last_post': post,
+        'last_activity': post.created,
+        'last_post_text': Truncator(post.text).chars(
+            settings.GROUP_PREVIEW_LENGTH),
+        'last_post_author': post.author.username,
+    }
+
+
+def change_group_stats(group_id: int, delta: int) -> None:
+    """Shift the group's post total by ``delta``, refresh its newest post.
+
+    A missing stats row is created from live values.
+    """
+    stats = GroupStats.objects.filter(group_id=group_id)
+    if delta < 0:
+        stats = stats.filter(posts_count__gte=-delta)
+    latest = _latest_post_fields(group_id)
+    updated = stats.update(posts_count=F('posts_count') + delta, **latest)
+    if not updated and Group.objects.filter(pk=group_id).exists():
+        GroupStats.objects.get_or_create(
+            group_id=group_id,
+            defaults={
+                'posts_count': Post.objects.filter(group_id=group_id).count(),
+                **latest,
+            }
+        )
+
+
+def rename_group_stats_author(author: User) -> int:
+    """Store the new username of ``author`` in the stats of the groups
+    whose newest post is theirs. Return how many groups changed."""
+    return GroupStats.objects.filter(last_post__author=author).exclude(
+        last_post_author=author.username
+    ).update(last_post_author=author.username)
+
+
+def get_posts_count(author: User) -> int:
+    """Return the stored post total, creating it on first access."""
+    try:
+        return author.stats.posts_count
+    except AuthorStats.DoesNotExist:
+        stats, _ = AuthorStats.objects.get_or_create(
+            author=author, defaults=_live_stats(author.id))
+        return stats.posts_count
+
+
+def _recount_authors(author_ids: Iterable[int], field: str,
+                     rows: QuerySet) -> int:
+    """Store the live ``field`` totals of these authors.
+
+    ``rows`` are counted per ``author_id``. Return how many stored
+    totals were wrong or missing.
+    """
+    counts = dict.fromkeys(author_ids, 0)
+    counts.update(
+        rows.filter(author_id__in=counts)
+        .order_by()
+        .values_list('author_id')
+        .annotate(total=Count('id'))
+    )
+    stored = dict(
+        AuthorStats.objects.filter(author_id__in=counts)
+        .values_list('author_id', field)
+    )
+    wrong = [
+        AuthorStats(author_id=author_id, **{field: total})
+        for author_id, total in counts.items()
+        if author_id in stored and stored[author_id] != total
+    ]
+    missing = [
+        AuthorStats(author_id=author_id, **{field: total})
+        for author_id, total in counts.items()
+        if author_id not in stored
+    ]
+    AuthorStats.objects.bulk_update(wrong, (field,))
+    AuthorStats.objects.bulk_create(missing)
+    return len(wrong) + len(missing)
+
+
+def recount_posts(author_ids: Iterable[int]) -> int:
+    """Store the live post totals of these authors.
+
+    Return how many stored totals were wrong or missing.
+    """
+    return _recount_authors(author_ids, 'posts_count', Post.objects.all())
+
+
+def recount_followers(author_ids: Iterable[int]) -> int:
+    """Store the live follower totals of these authors.
+
+    Return how many stored totals were wrong or missing.
+    """
+    return _recount_authors(
+        author_ids, 'followers_count', Follow.objects.all())
+
+
+def recount_groups(group_ids: Iterable[int]) -> int:
+    """Store the live post totals and newest posts of these groups.
+
+    Return how many groups were recounted.
+    """
+    counts = dict.fromkeys(group_ids, 0)
+    counts.update(
+        Post.objects.filter(group_id__in=counts)
+        .order_by()
+        .values_list('group_id')
+        .annotate(total=Count('id'))
+    )
+    stored = set(GroupStats.objects.filter(
+        group_id__in=counts).values_list('group_id', flat=True))
+    stats = [
+        GroupStats(group_id=group_id, posts_count=total,
+                   **_latest_post_fields(group_id))
+        for group_id, total in counts.items()
+    ]
+    GroupStats.objects.bulk_update(
+        [row for row in stats if row.group_id in stored],
+        ('posts_count', 'last_activity', 'last_post', 'last_post_text',
+         'last_post_author')
+    )
+    GroupStats.objects.bulk_create(
+        [row for row in stats if row.group_id not in stored])
+    return len(stats)
+
+
+def recount_comments(posts: List[Post]) -> int:
+    """Store the live comment totals of these posts.
+
+    Return how many stored totals were wrong.
+    """
+    counts = dict(
+        Comment.objects.filter(post_id__in=[post.id for post in posts])
+        .order_by()
+        .values_list('post_id')
+        .annotate(total=Count('id'))
+    )
+    wrong = []
+    for post in posts:
+        total = counts.get(post.id, 0)
+        if post.comments_count != total:
+            post.comments_count = total
+            wrong.append(post)
+    Post.objects.bulk_update(wrong, ('comments_count',))
+    return len(wrong)
+
+
+def _repair_authors(batch_size: int,
+                    recount: Callable[[List[int]], int]) -> int:
+    repaired = 0
+    last_id = 0
+    while True:
+        author_ids = list(
+            User.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not author_ids:
+            return repaired
+        last_id = author_ids[-1]
+        with transaction.atomic():
+            repaired += recount(author_ids)
+
+
+def repair_posts_counts(batch_size: int) -> int:
+    """Recompute every author's post total, return how many were wrong."""
+    return _repair_authors(batch_size, recount_posts)
+
+
+def repair_followers_counts(batch_size: int) -> int:
+    """Recompute every author's follower total, return how many were wrong."""
+    return _repair_authors(batch_size, recount_followers)
+
+
+def repair_group_stats(batch_size: int) -> int:
+    """Recompute the stats of every group, return how many there are."""
+    repaired = 0
+    last_id = 0
+    while True:
+        group_ids = list(
+            Group.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not group_ids:
+            return repaired
+        last_id = group_ids[-1]
+        with transaction.atomic():
+            repaired += recount_groups(group_ids)
+
+
+def repair_comments_counts(batch_size: int) -> int:
+    """Recompute every post's comment total, return how many were wrong."""
+    repaired = 0
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'comments_count')[:batch_size]
+        )
+        if not posts:
+            return repaired
+        last_id = posts[-1].id
+        with transaction.atomic():
+            repaired += recount_comments(posts)
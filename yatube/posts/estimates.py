@@ -0,0 +1,64 @@
+"""Row counts kept off the request path.
+
+A count is served from the cache, however old, and recounted by a
+background thread once it is older than ``COUNT_ESTIMATE_TTL`` seconds.
+Until the first recount finishes there is no estimate at all.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models.query import QuerySet
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _count_key(name: str) -> str:
+    return f'count-estimate:{name}'
+
+
+def _job_key(name: str) -> str:
+    return f'count-estimate-job:{name}'
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='estimates')
+        return _executor
+
+
+def _recount(name: str, queryset: QuerySet) -> None:
+    try:
+        cache.set(_count_key(name), (queryset.count(), time.time()), None)
+    except Exception:
+        logger.exception('Counting %s failed', name)
+    finally:
+        cache.delete(_job_key(name))
+        connections.close_all()
+
+
+def estimated_count(name: str, queryset: QuerySet) -> Optional[int]:
+    """Return the last known number of rows of ``queryset``, or ``None``.
+
+    A stale or missing count is recounted in the background, unless the
+    caller is inside a transaction the recount could not see.
+    """
+    stored = cache.get(_count_key(name))
+    stale = stored is None or (
+        time.time() - stored[1] > settings.COUNT_ESTIMATE_TTL)
+    if (stale and not connection.in_atomic_block
+            and cache.add(_job_key(name), True,
+                          settings.COUNT_ESTIMATE_TTL)):
+        _get_executor().submit(_recount, name, queryset)
+    return stored and stored[0]
@@ -0,0 +1,77 @@
+"""Streaming export of an author's posts and comments.
+
+Records use the format read by ``import_posts``. Rows are fetched with
+``QuerySet.iterator()`` in chunks and written out one at a time, so
+memory does not depend on how much the author wrote.
+
+Comments the author wrote on other authors' posts are exported too.
+Their post is not in the export, so ``import_posts`` counts them as
+orphans instead of storing them.
+"""
+import csv
+import json
+from typing import Iterator
+
+from django.conf import settings
+
+from .models import Comment, Post, User
+
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+FIELDS = ('type', 'id', 'post', 'author', 'group', 'text', 'created')
+
+
+def export_records(author: User) -> Iterator[dict]:
+    """Yield the posts of ``author`` and then the comments they wrote."""
+    posts = (
+        Post.objects.filter(author=author)
+        .order_by('id')
+        .values_list('id', 'group__slug', 'text', 'created')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    for post_id, group, text, created in posts:
+        yield {
+            'type': 'post',
+            'id': post_id,
+            'author': author.username,
+            'group': group,
+            'text': text,
+            'created': created.isoformat(),
+        }
+    comments = (
+        Comment.objects.filter(author=author)
+        .order_by('id')
+        .values_list('id', 'post_id', 'text', 'created')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    for comment_id, post_id, text, created in comments:
+        yield {
+            'type': 'comment',
+            'id': comment_id,
+            'post': post_id,
+            'author': author.username,
+            'text': text,
+            'created': created.isoformat(),
+        }
+
+
+class _Echo:
+    """File-like object handing back what ``csv.writer`` writes."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def render_records(records: Iterator[dict], file_format: str) -> Iterator[str]:
+    """Yield ``records`` serialized one line at a time."""
+    if file_format == 'csv':
+        writer = csv.DictWriter(_Echo(), FIELDS)
+        yield writer.writeheader()
+        for record in records:
+            yield writer.writerow(record)
+        return
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
@@ -1,16 +1,51 @@
 from xml.etree.ElementTree import Comment
 from django import forms
 
-from .models import Post, Comment
+from .images import ImageTooLarge, check_upload, ingest_image
+from .models import Group, Post, Comment
+
+
+class PostImageField(forms.ImageField):
+    """Image field storing a reduced copy instead of the upload."""
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return None
+        try:
+            check_upload(data)
+        except ImageTooLarge as error:
+            raise forms.ValidationError(str(error), code='image_too_large')
+        return ingest_image(super().to_python(data))
 
 
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': PostImageField}
 
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(
+        label='Запрос',
+        max_length=200,
+        required=False
+    )
+    author = forms.CharField(
+        label='Автор',
+        help_text='Имя пользователя',
+        max_length=150,
+        required=False
+    )
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        label='Группа',
+        to_field_name='slug',
+        required=False
+    )
@@ -0,0 +1,217 @@
+"""Ingest of uploaded post images and their responsive variants.
+
+Uploads are streamed to a temporary file and the original never reaches
+storage: it is checked against the size and pixel limits, reduced to
+``POST_IMAGE_MAX_SIZE`` and re-encoded without its metadata.
+
+Width variants for ``srcset`` are made offline by the
+``generate_image_variants`` command.
+"""
+import io
+import logging
+import os
+from typing import List
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_feed_versions, post_feeds
+from .models import Post, PostImageVariant
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {
+    'AVIF': 'avif', 'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp',
+}
+FORMAT_TYPES = {
+    'AVIF': 'image/avif', 'JPEG': 'image/jpeg', 'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Stream every upload to disk, dropping bytes over the size limit.
+
+    The reported ``size`` still counts every byte received, so the form
+    can reject the file without it ever filling the disk.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        room = settings.POST_IMAGE_MAX_UPLOAD_SIZE - start
+        if room > 0:
+            self.file.write(raw_data[:room])
+
+
+def check_upload(upload) -> None:
+    """Reject uploads over the byte and pixel limits without decoding.
+
+    Only the image header is read. Files Pillow cannot identify are left
+    for ``forms.ImageField`` to report.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ImageTooLarge(
+            f'Файл больше '
+            f'{settings.POST_IMAGE_MAX_UPLOAD_SIZE // 2 ** 20} МБ.'
+        )
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = settings.POST_IMAGE_MAX_PIXELS
+    except Exception:
+        return
+    finally:
+        upload.seek(0)
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Изображение больше '
+            f'{settings.POST_IMAGE_MAX_PIXELS // 10 ** 6} Мп.'
+        )
+
+
+def _save_options(image_format: str) -> dict:
+    options = {'optimize': True}
+    if image_format in ('AVIF', 'JPEG', 'WEBP'):
+        options['quality'] = settings.POST_IMAGE_QUALITY
+    if image_format == 'JPEG':
+        options['progressive'] = True
+    if image_format == 'WEBP':
+        # Three times faster than the default effort, same size.
+        options['method'] = 2
+    return options
+
+
+def ingest_image(upload) -> ContentFile:
+    """Return ``upload`` downscaled and re-encoded, without metadata."""
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    upload.seek(0)
+    with Image.open(upload) as image:
+        ratio = max_size / max(image.size)
+        if ratio < 1:
+            # Lets JPEG decode straight at a fraction of the full size.
+            image.draft('RGB', (int(image.width * ratio),
+                                int(image.height * ratio)))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        has_alpha = (image.mode in ('RGBA', 'LA', 'PA')
+                     or 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    image_format = settings.POST_IMAGE_FORMAT
+    if has_alpha and image_format == 'JPEG':
+        image_format = 'PNG'
+    options = _save_options(image_format)
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(
+        buffer.getvalue(),
+        name=f'{stem}.{FORMAT_EXTENSIONS[image_format]}'
+    )
+
+
+def variant_formats() -> List[str]:
+    """Return the configured variant formats this Pillow can write.
+
+    AVIF needs a Pillow plugin such as ``pillow-avif-plugin``.
+    """
+    Image.init()
+    return [image_format
+            for image_format in settings.POST_IMAGE_VARIANT_FORMATS
+            if image_format in Image.SAVE]
+
+
+def variant_widths(source_width: int) -> List[int]:
+    """Return the variant widths worth making for a source this wide."""
+    widths = settings.POST_IMAGE_VARIANT_WIDTHS
+    return [width for width in widths if width <= source_width] or [
+        min(widths)]
+
+
+def make_variants(post: Post) -> List[PostImageVariant]:
+    """Replace the variants of ``post`` with ones of its current image.
+
+    The post's ``modified`` time and its feeds are bumped, so cached
+    cards and pages pick the new variants up.
+    """
+    with post.image.open('rb'), Image.open(post.image) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    aspect_width, aspect_height = settings.POST_IMAGE_VARIANT_ASPECT
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    variants = []
+    for width in variant_widths(image.width):
+        height = round(width * aspect_height / aspect_width)
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for image_format in variant_formats():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **_save_options(image_format))
+            variant = PostImageVariant(
+                post=post,
+                source=post.image.name,
+                format=image_format,
+                width=width,
+                height=height,
+            )
+            variant.image.save(
+                f'{stem}-{width}.{FORMAT_EXTENSIONS[image_format]}',
+                ContentFile(buffer.getvalue()),
+                save=False
+            )
+            variants.append(variant)
+
+    with transaction.atomic():
+        stale = list(post.image_variants.all())
+        post.image_variants.all().delete()
+        PostImageVariant.objects.bulk_create(variants)
+        Post.objects.filter(pk=post.pk).update(modified=timezone.now())
+        bump_feed_versions(post_feeds(post))
+    for variant in stale:
+        variant.image.delete(save=False)
+    return variants
+
+
+def generate_missing_variants(batch_size: int, force: bool = False) -> int:
+    """Make variants for posts that have none of their current image.
+
+    Return how many posts got new variants.
+    """
+    generated = 0
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .exclude(image='')
+            .select_related('author')
+            .prefetch_related('image_variants')
+            .order_by('id')[:batch_size]
+        )
+        if not posts:
+            return generated
+        last_id = posts[-1].id
+        for post in posts:
+            current = any(variant.source == post.image.name
+                          for variant in post.image_variants.all())
+            if current and not force:
+                continue
+            try:
+                make_variants(post)
+            except (OSError, ValueError, SyntaxError,
+                    Image.DecompressionBombError):
+                # Pillow reports broken or oversized files with any of
+                # these; one bad image must not stop the batch.
+                logger.exception('Variants of post %s failed', post.id)
+                continue
+            generated += 1
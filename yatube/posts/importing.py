@@ -0,0 +1,324 @@
+"""Bulk import of posts and comments exported from another system.
+
+Records come one per JSONL line or CSV row::
+
+    {"type": "post", "id": 17, "author": "leo", "group": "cats",
+     "text": "...", "created": "2019-05-01T12:00:00+00:00"}
+    {"type": "comment", "post": 17, "author": "anna", "text": "..."}
+
+CSV files have a header row with the same field names.
+
+``id`` and ``post`` are ids of the source system. The database gives
+every imported row a new id; ``ImportedPost`` maps the source ids of a
+source to the new posts, so that comments find their post, and
+``ImportedComment`` the comment records. A batch replayed after a crash
+finds its rows there and inserts nothing twice. Comments must come
+after their post; a comment on a post that is not in the import, such
+as one an author wrote under someone else's post, is skipped and
+counted as an orphan.
+"""
+import csv
+import itertools
+import json
+import os
+import time
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Set,
+                    Tuple, Union)
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bulk import batched, bulk_create_with_ids, explicit_timestamps
+from .cache import (bump_feed_versions, group_feed, groups_feed, index_feed,
+                    profile_feed)
+from .counters import recount_comments, recount_groups, recount_posts
+from .timelines import fan_out_posts
+from .models import (Comment, Group, ImportedComment, ImportedPost, Post,
+                     User)
+
+FORMATS = ('jsonl', 'csv')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_records(file, file_format: str) -> Iterator[Union[dict, str]]:
+    """Yield the records of an open text file one at a time.
+
+    JSONL lines are yielded unparsed, so that a broken line only skips
+    itself.
+    """
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield line
+
+
+class Checkpoint:
+    """Import progress kept in a JSON file next to the input.
+
+    ``skipped`` is derived, since every record read is either a stored
+    post or comment or skipped. ``orphans`` counts the skipped comments
+    whose post is not in the import.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self.posts = 0
+        self.comments = 0
+        self.orphans = 0
+        if os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+            for key in ('records', 'posts', 'comments', 'orphans'):
+                setattr(self, key, state.get(key, 0))
+
+    @property
+    def skipped(self) -> int:
+        return self.records - self.posts - self.comments
+
+    def save(self) -> None:
+        state = {'records': self.records, 'posts': self.posts,
+                 'comments': self.comments, 'orphans': self.orphans,
+                 'skipped': self.skipped}
+        with open(self.path + '.tmp', 'w') as file:
+            json.dump(state, file)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class Importer:
+    """Insert records in batches, one transaction per batch.
+
+    ``source`` names the system the ids of the records belong to.
+    ``on_invalid`` is called with the record number and the reason of
+    every record that is skipped.
+    """
+
+    def __init__(self, checkpoint: Checkpoint, batch_size: int,
+                 on_invalid: Callable[[int, str], None], source: str):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.on_invalid = on_invalid
+        self.source = source
+        self.authors: Dict[str, int] = dict(
+            User.objects.values_list('username', 'id'))
+        self.groups: Dict[str, int] = dict(
+            Group.objects.values_list('slug', 'id'))
+        self.password = make_password(None)
+        self.touched_authors = set()
+        self.touched_groups = set()
+
+    def run(self, records: Iterable) -> Iterator[Checkpoint]:
+        """Import ``records``, yielding the checkpoint after every batch.
+
+        Records a previous run already committed are skipped.
+        """
+        remaining = itertools.islice(
+            enumerate(records), self.checkpoint.records, None)
+        for batch in batched(remaining, self.batch_size):
+            self.import_batch(batch)
+            self.checkpoint.records = batch[-1][0] + 1
+            self.checkpoint.save()
+            yield self.checkpoint
+        self.invalidate_pages()
+
+    def import_batch(self, batch: List[Tuple[int, Any]]) -> None:
+        posts, comments = [], []
+        for number, record in batch:
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                if record.get('type') == 'post':
+                    posts.append(self.clean_post(number, record))
+                elif record.get('type') == 'comment':
+                    comments.append(self.clean_comment(number, record))
+                else:
+                    raise InvalidRecord(f'bad type {record.get("type")!r}')
+            except (InvalidRecord, KeyError, TypeError, ValueError) as error:
+                self.skip(number, str(error))
+
+        with transaction.atomic():
+            self.create_missing(
+                {row['author'] for row in posts + comments},
+                {row['group'] for row in posts} - {None},
+            )
+            posts, posts_stored = self.store_posts(posts)
+            comments, comments_stored, orphans = self.store_comments(
+                comments)
+            # bulk_create sends no post_save, so nothing fans them out.
+            fan_out_posts(posts)
+            recount_posts({post.author_id for post in posts})
+            recount_groups({post.group_id for post in posts} - {None})
+            recount_comments(list(
+                Post.objects.filter(
+                    id__in={comment.post_id for comment in comments})
+                .only('id', 'comments_count')
+            ))
+        self.checkpoint.posts += posts_stored
+        self.checkpoint.comments += comments_stored
+        self.checkpoint.orphans += orphans
+        self.touched_authors.update(post.author_id for post in posts)
+        self.touched_groups.update(
+            post.group_id for post in posts if post.group_id)
+
+    def store_posts(self, rows: List[dict]) -> Tuple[List[Post], int]:
+        """Insert the posts not stored yet and map their source ids.
+
+        Returns the new posts and how many records of ``rows`` are
+        stored, counting those of a replayed batch.
+        """
+        stored = dict(ImportedPost.objects.filter(
+            source=self.source,
+            source_id__in={row['source_id'] for row in rows},
+        ).values_list('source_id', 'record'))
+        new, replayed = [], 0
+        for row in rows:
+            if row['source_id'] not in stored:
+                stored[row['source_id']] = row['number']
+                new.append(row)
+            elif stored[row['source_id']] == row['number']:
+                replayed += 1
+            else:
+                self.skip(row['number'], f'duplicate id {row["source_id"]}')
+        posts = [
+            Post(
+                author_id=self.authors[row['author']],
+                group_id=self.groups.get(row['group']),
+                text=row['text'],
+                created=row['created'],
+                modified=row['created'],
+            )
+            for row in new
+        ]
+        with explicit_timestamps(Post):
+            bulk_create_with_ids(Post, posts)
+        ImportedPost.objects.bulk_create(
+            ImportedPost(source=self.source, source_id=row['source_id'],
+                         record=row['number'], post_id=post.id)
+            for row, post in zip(new, posts)
+        )
+        return posts, len(posts) + replayed
+
+    def store_comments(self,
+                       rows: List[dict]) -> Tuple[List[Comment], int, int]:
+        """Insert the comments not stored yet on their imported posts.
+
+        Returns the new comments, how many records of ``rows`` are
+        stored, counting those of a replayed batch, and how many are
+        skipped as orphans.
+        """
+        stored = set(ImportedComment.objects.filter(
+            source=self.source,
+            record__in={row['number'] for row in rows},
+        ).values_list('record', flat=True))
+        post_ids = dict(ImportedPost.objects.filter(
+            source=self.source,
+            source_id__in={row['post'] for row in rows},
+        ).values_list('source_id', 'post_id'))
+        new, replayed, orphans = [], 0, 0
+        for row in rows:
+            if row['number'] in stored:
+                replayed += 1
+            elif row['post'] in post_ids:
+                new.append(row)
+            else:
+                orphans += 1
+                self.skip(row['number'], 'unknown post')
+        comments = [
+            Comment(
+                post_id=post_ids[row['post']],
+                author_id=self.authors[row['author']],
+                text=row['text'],
+                created=row['created'],
+            )
+            for row in new
+        ]
+        with explicit_timestamps(Comment):
+            bulk_create_with_ids(Comment, comments)
+        ImportedComment.objects.bulk_create(
+            ImportedComment(source=self.source, record=row['number'],
+                            comment_id=comment.id)
+            for row, comment in zip(new, comments)
+        )
+        return comments, len(comments) + replayed, orphans
+
+    def skip(self, number: int, reason: str) -> None:
+        self.on_invalid(number, reason)
+
+    def clean_post(self, number: int, record: dict) -> dict:
+        return {
+            'number': number,
+            'source_id': int(record['id']),
+            'author': self.required(record, 'author'),
+            'group': record.get('group') or None,
+            'text': self.required(record, 'text'),
+            'created': self.created(record),
+        }
+
+    def clean_comment(self, number: int, record: dict) -> dict:
+        return {
+            'number': number,
+            'post': int(record['post']),
+            'author': self.required(record, 'author'),
+            'text': self.required(record, 'text'),
+            'created': self.created(record),
+        }
+
+    @staticmethod
+    def required(record: dict, field: str) -> str:
+        value = record.get(field)
+        if not value:
+            raise InvalidRecord(f'no {field}')
+        return value
+
+    @staticmethod
+    def created(record: dict):
+        if not record.get('created'):
+            return timezone.now()
+        created = parse_datetime(record['created'])
+        if created is None:
+            raise InvalidRecord(f'bad created {record["created"]!r}')
+        if timezone.is_naive(created):
+            created = timezone.make_aware(created)
+        return created
+
+    def create_missing(self, usernames: Set[str], slugs: Set[str]) -> None:
+        """Create authors and groups the lookup tables do not know."""
+        usernames -= self.authors.keys()
+        if usernames:
+            User.objects.bulk_create(
+                [User(username=username, password=self.password)
+                 for username in usernames],
+                ignore_conflicts=True
+            )
+            self.authors.update(User.objects.filter(
+                username__in=usernames).values_list('username', 'id'))
+        slugs -= self.groups.keys()
+        if slugs:
+            Group.objects.bulk_create(
+                [Group(title=slug, slug=slug, description='')
+                 for slug in slugs],
+                ignore_conflicts=True
+            )
+            self.groups.update(Group.objects.filter(
+                slug__in=slugs).values_list('slug', 'id'))
+
+    def invalidate_pages(self) -> None:
+        feeds = [index_feed(), groups_feed()]
+        feeds.extend(profile_feed(username) for username in User.objects
+                     .filter(id__in=self.touched_authors)
+                     .values_list('username', flat=True))
+        feeds.extend(group_feed(slug) for slug in Group.objects
+                     .filter(id__in=self.touched_groups)
+                     .values_list('slug', flat=True))
+        bump_feed_versions(feeds)
+
+
+def throughput(records: int, started: float) -> float:
+    return records / max(time.perf_counter() - started, 1e-9)
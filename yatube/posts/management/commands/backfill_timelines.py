@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Follow
+from posts.timelines import backfill
+
+
+class Command(BaseCommand):
+    help = ('Заполняет ленты подписок последними постами авторов, '
+            'например после загрузки подписок в обход сайта.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Заполнить только ленту этого пользователя.'
+        )
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=settings.FOLLOW_BACKFILL_POSTS,
+            help='Сколько последних постов автора добавить в ленту.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько подписок обрабатывать в одной транзакции.'
+        )
+
+    def handle(self, *args, user, posts, batch_size, **options):
+        follows = Follow.objects.order_by('id')
+        if user:
+            follows = follows.filter(user__username=user)
+        last_id = 0
+        done = 0
+        while True:
+            batch = list(follows.filter(id__gt=last_id).values_list(
+                'id', 'user_id', 'author_id')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            with transaction.atomic():
+                for _, user_id, author_id in batch:
+                    backfill(user_id, author_id, posts)
+            done += len(batch)
+            self.stdout.write(f'Подписок обработано: {done}')
+        self.stdout.write(self.style.SUCCESS('Ленты заполнены.'))
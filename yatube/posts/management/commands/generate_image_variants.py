@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import generate_missing_variants, variant_formats
+
+
+class Command(BaseCommand):
+    help = 'Создаёт варианты картинок постов разной ширины для srcset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько постов загружать за один запрос.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты и у постов, где они уже есть.'
+        )
+
+    def handle(self, *args, batch_size, force, **options):
+        self.stdout.write(f'Форматы: {", ".join(variant_formats())}')
+        posts = generate_missing_variants(batch_size, force)
+        self.stdout.write(f'Созданы варианты картинок постов: {posts}')
@@ -0,0 +1,70 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importing import (FORMATS, Checkpoint, Importer, read_records,
+                             throughput)
+
+
+class Command(BaseCommand):
+    help = ('Загружает посты и комментарии из JSONL или CSV, '
+            'продолжая с контрольной точки после сбоя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL или CSV.')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла; по умолчанию по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько записей вставлять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--source',
+            help=('Имя системы, к которой относятся id записей; '
+                  'по умолчанию имя файла без расширения. Повторный '
+                  'импорт того же источника не создаёт дублей.')
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки; по умолчанию <path>.checkpoint.'
+        )
+
+    def handle(self, *args, path, batch_size, **options):
+        file_format = options['format'] or os.path.splitext(
+            path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Не удалось определить формат {path}, укажите --format.')
+        checkpoint = Checkpoint(
+            options['checkpoint'] or f'{path}.checkpoint')
+        if checkpoint.records:
+            self.stdout.write(
+                f'Продолжаем с записи {checkpoint.records + 1}.')
+
+        source = options['source'] or os.path.splitext(
+            os.path.basename(path))[0]
+        importer = Importer(
+            checkpoint, batch_size, self.report_invalid, source)
+        started = time.perf_counter()
+        first = checkpoint.records
+        with open(path, newline='', encoding='utf-8') as file:
+            for state in importer.run(read_records(file, file_format)):
+                self.stdout.write(
+                    f'Записей: {state.records}, постов: {state.posts}, '
+                    f'комментариев: {state.comments}, '
+                    f'пропущено: {state.skipped}, '
+                    f'из них без поста в импорте: {state.orphans}, '
+                    f'{throughput(state.records - first, started):.0f} '
+                    f'записей/с'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён за {time.perf_counter() - started:.1f} с.'))
+
+    def report_invalid(self, number, reason):
+        self.stderr.write(f'Запись {number + 1} пропущена: {reason}')
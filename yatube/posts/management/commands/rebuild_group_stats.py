@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import bump_feed_versions, groups_feed
+from posts.counters import repair_group_stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает с нуля число постов, последнюю активность '
+            'и последний пост каждой группы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько групп пересчитывать в одной транзакции.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        groups = repair_group_stats(batch_size)
+        bump_feed_versions([groups_feed()])
+        self.stdout.write(f'Пересчитано групп: {groups}')
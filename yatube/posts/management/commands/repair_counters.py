@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import (repair_comments_counts, repair_followers_counts,
+                            repair_posts_counts)
+from posts.timelines import sync_fan_out
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов и подписчиков авторов '
+            'и комментариев постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать в одной транзакции.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        posts = repair_posts_counts(batch_size)
+        self.stdout.write(f'Исправлено счётчиков постов: {posts}')
+        followers = repair_followers_counts(batch_size)
+        self.stdout.write(f'Исправлено счётчиков подписчиков: {followers}')
+        refilled = sync_fan_out()
+        if refilled:
+            self.stdout.write(
+                f'Заполнены ленты подписчиков авторов: {refilled}')
+        comments = repair_comments_counts(batch_size)
+        self.stdout.write(f'Исправлено счётчиков комментариев: {comments}')
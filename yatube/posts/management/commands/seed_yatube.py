@@ -0,0 +1,223 @@
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from posts.bulk import batched, explicit_timestamps
+from posts.cache import bump_feed_versions, groups_feed, index_feed
+from posts.counters import (repair_comments_counts, repair_group_stats,
+                            repair_posts_counts)
+from posts.models import Comment, Group, Post, User
+
+SENTENCES = 2000
+IMAGES = 20
+# Zipf exponents: a few authors write most posts, a few groups are hot.
+AUTHOR_SKEW = 1.1
+GROUP_SKEW = 1.3
+UNGROUPED_SHARE = 0.3
+# The newest posts get most comments: the n-th newest post out of N is
+# picked with probability falling as a power of n / N.
+COMMENT_RECENCY = 2
+COMMENT_DELAY = timedelta(days=7)
+
+
+def zipf_weights(count, skew):
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами и комментариями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=400_000)
+        parser.add_argument(
+            '--images',
+            type=float,
+            default=0,
+            help='Доля постов с картинкой, от 0 до 1.'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько последних дней раскидать посты.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько строк вставлять в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.sentences = [self.fake.sentence(nb_words=10)
+                          for _ in range(SENTENCES)]
+
+        user_ids = self.seed_users(options['users'])
+        group_ids = self.seed_groups(options['groups'])
+        images = self.seed_images() if options['images'] else []
+        end = timezone.now()
+        start = end - timedelta(days=options['days'])
+        first_post_id = self.seed_posts(
+            options['posts'], user_ids, group_ids, images,
+            options['images'], start, end)
+        self.seed_comments(
+            options['comments'], user_ids, first_post_id, options['posts'],
+            start, end)
+
+        started = time.perf_counter()
+        repair_posts_counts(self.batch_size)
+        repair_comments_counts(self.batch_size)
+        repair_group_stats(self.batch_size)
+        bump_feed_versions([index_feed(), groups_feed()])
+        self.stdout.write(
+            f'Счётчики пересчитаны за {time.perf_counter() - started:.1f} с')
+
+    def insert(self, model, rows, total):
+        """Insert the generated ``rows`` in batches, reporting progress."""
+        started = time.perf_counter()
+        inserted = 0
+        with explicit_timestamps(model):
+            for batch in batched(rows, self.batch_size):
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                inserted += len(batch)
+                self.stdout.write(
+                    f'\r{model._meta.verbose_name_plural}: '
+                    f'{inserted}/{total}', ending='')
+        self.stdout.write(
+            f'\r{model._meta.verbose_name_plural}: {inserted} '
+            f'за {time.perf_counter() - started:.1f} с')
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def text(self, sentences):
+        return ' '.join(self.rnd.choices(self.sentences, k=sentences))
+
+    def seed_users(self, count):
+        first_id = self.next_id(User)
+        password = make_password(None)
+        joined = timezone.now()
+        self.insert(User, (
+            User(
+                id=user_id,
+                username=f'{self.fake.user_name()}_{user_id}',
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                password=password,
+                date_joined=joined,
+            )
+            for user_id in range(first_id, first_id + count)
+        ), count)
+        user_ids = list(range(first_id, first_id + count))
+        # Hot authors are spread over the id range, not the first ids.
+        self.rnd.shuffle(user_ids)
+        return user_ids
+
+    def seed_groups(self, count):
+        first_id = self.next_id(Group)
+        self.insert(Group, (
+            Group(
+                id=group_id,
+                title=self.fake.catch_phrase()[:200],
+                slug=f'group-{group_id}',
+                description=self.text(3),
+            )
+            for group_id in range(first_id, first_id + count)
+        ), count)
+        return list(range(first_id, first_id + count))
+
+    def seed_images(self):
+        """Store a small pool of images shared by all seeded posts."""
+        names = []
+        for number in range(IMAGES):
+            image = Image.new('RGB', (960, 540), tuple(
+                self.rnd.randrange(256) for _ in range(3)))
+            ImageDraw.Draw(image).text((40, 40), f'seed {number}')
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=80)
+            names.append(default_storage.save(
+                f'posts/seed/{number}.jpg', ContentFile(buffer.getvalue())))
+        return names
+
+    def seed_posts(self, count, user_ids, group_ids, images, image_share,
+                   start, end):
+        first_id = self.next_id(Post)
+        author_weights = zipf_weights(len(user_ids), AUTHOR_SKEW)
+        group_weights = zipf_weights(len(group_ids), GROUP_SKEW)
+        step = (end - start) / max(count, 1)
+
+        def rows():
+            for number in range(count):
+                created = start + step * number
+                group_id = None
+                if group_ids and self.rnd.random() >= UNGROUPED_SHARE:
+                    group_id = self.rnd.choices(
+                        group_ids, cum_weights=group_weights)[0]
+                image = ''
+                if images and self.rnd.random() < image_share:
+                    image = self.rnd.choice(images)
+                yield Post(
+                    id=first_id + number,
+                    text=self.text(self.rnd.randint(1, 6)),
+                    author_id=self.rnd.choices(
+                        user_ids, cum_weights=author_weights)[0],
+                    group_id=group_id,
+                    image=image,
+                    created=created,
+                    modified=created,
+                )
+
+        self.insert(Post, rows(), count)
+        return first_id
+
+    def seed_comments(self, count, user_ids, first_post_id, posts, start,
+                      end):
+        if not posts:
+            return
+        first_id = self.next_id(Comment)
+        author_weights = zipf_weights(len(user_ids), AUTHOR_SKEW)
+        step = (end - start) / posts
+
+        def rows():
+            for number in range(count):
+                age = int(posts * self.rnd.random() ** COMMENT_RECENCY)
+                post_number = posts - 1 - age
+                created = min(
+                    start + step * post_number
+                    + COMMENT_DELAY * self.rnd.random(),
+                    end
+                )
+                yield Comment(
+                    id=first_id + number,
+                    post_id=first_post_id + post_number,
+                    author_id=self.rnd.choices(
+                        user_ids, cum_weights=author_weights)[0],
+                    text=self.text(self.rnd.randint(1, 2)),
+                    created=created,
+                )
+
+        self.insert(Comment, rows(), count)
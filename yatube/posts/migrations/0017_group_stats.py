@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:30
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+import django.db.models.deletion
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+
+    stats = []
+    for group_id in Group.objects.values_list('id', flat=True).iterator():
+        posts = Post.objects.filter(group_id=group_id)
+        latest = posts.select_related('author').order_by(
+            '-created', '-id').first()
+        stats.append(GroupStats(
+            group_id=group_id,
+            posts_count=posts.count(),
+            last_activity=latest and latest.created,
+            last_post=latest,
+            last_post_text=latest and Truncator(latest.text).chars(200) or '',
+            last_post_author=latest and latest.author.username or '',
+        ))
+    GroupStats.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_follow_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+                ('last_activity', models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего поста')),
+                ('last_post_text', models.TextField(blank=True, verbose_name='Начало последнего поста')),
+                ('last_post_author', models.CharField(blank=True, max_length=150, verbose_name='Автор последнего поста')),
+                ('last_post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='posts.Post', verbose_name='Последний пост')),
+            ],
+            options={
+                'verbose_name': 'group stats',
+                'verbose_name_plural': 'group stats',
+            },
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
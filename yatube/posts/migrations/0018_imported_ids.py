@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_group_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedPost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Источник')),
+                ('source_id', models.BigIntegerField(verbose_name='Id в источнике')),
+                ('record', models.PositiveIntegerField(verbose_name='Номер записи')),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'imported post',
+                'verbose_name_plural': 'imported posts',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportedComment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Источник')),
+                ('record', models.PositiveIntegerField(verbose_name='Номер записи')),
+                ('comment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Comment', verbose_name='Комментарий')),
+            ],
+            options={
+                'verbose_name': 'imported comment',
+                'verbose_name_plural': 'imported comments',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='importedpost',
+            constraint=models.UniqueConstraint(fields=('source', 'source_id'), name='posts_importedpost_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='importedcomment',
+            constraint=models.UniqueConstraint(fields=('source', 'record'), name='posts_importedcomment_unique'),
+        ),
+    ]
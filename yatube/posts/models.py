@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
-from core.models import CreatedModel
+from core.models import CreatedModel, LoadedValuesMixin
 
 
 User = get_user_model()
@@ -31,7 +31,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(CreatedModel):
+class Post(LoadedValuesMixin, CreatedModel):
     text = models.TextField(
         'Текст',
         help_text='Введите текст поста'
@@ -56,11 +56,34 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'post'
         verbose_name_plural = 'posts'
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('-created', '-id'),
+                name='posts_post_created_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-created', '-id'),
+                name='posts_post_author_created_idx'
+            ),
+            models.Index(
+                fields=('group', '-created', '-id'),
+                name='posts_post_group_created_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -69,7 +92,7 @@ class Post(CreatedModel):
         return reverse("posts:post_detail", kwargs={"post_id": self.id})
 
 
-class Comment(CreatedModel):
+class Comment(LoadedValuesMixin, CreatedModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -92,6 +115,254 @@ class Comment(CreatedModel):
         verbose_name = 'comment'
         verbose_name_plural = 'comments'
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('post', '-created'),
+                name='posts_comment_post_created_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.text[:10]
+
+
+class AuthorStats(models.Model):
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0
+    )
+    # See posts.timelines: whether new posts are copied into followers'
+    # timelines.
+    fanned_out = models.BooleanField(
+        'Посты рассылаются по лентам',
+        default=True
+    )
+
+    class Meta:
+        verbose_name = 'author stats'
+        verbose_name_plural = 'author stats'
+
+    def __str__(self) -> str:
+        return f'{self.author_id}: {self.posts_count}'
+
+
+class GroupStats(models.Model):
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0
+    )
+    last_activity = models.DateTimeField(
+        'Дата последнего поста',
+        blank=True,
+        null=True
+    )
+    last_post = models.ForeignKey(
+        Post,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Последний пост'
+    )
+    last_post_text = models.TextField(
+        'Начало последнего поста',
+        blank=True
+    )
+    last_post_author = models.CharField(
+        'Автор последнего поста',
+        max_length=150,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'group stats'
+        verbose_name_plural = 'group stats'
+
+    def __str__(self) -> str:
+        return f'{self.group_id}: {self.posts_count}'
+
+
+class PostImageVariant(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Пост'
+    )
+    source = models.CharField(
+        'Исходная картинка',
+        max_length=100
+    )
+    format = models.CharField(
+        'Формат',
+        max_length=10
+    )
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/variants/',
+        width_field='width',
+        height_field='height'
+    )
+
+    class Meta:
+        verbose_name = 'post image variant'
+        verbose_name_plural = 'post image variants'
+        ordering = ('width',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('post', 'format', 'width'),
+                name='posts_imagevariant_unique'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.post_id}: {self.format} {self.width}w'
+
+
+class Follow(CreatedModel):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follower',
+        verbose_name='Подписчик'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='following',
+        verbose_name='Автор'
+    )
+
+    class Meta:
+        verbose_name = 'follow'
+        verbose_name_plural = 'follows'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='posts_follow_unique'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='posts_follow_not_self'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.user_id} -> {self.author_id}'
+
+
+class TimelineEntry(models.Model):
+    """A post in the following feed of one user, written on posting."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    created = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        verbose_name = 'timeline entry'
+        verbose_name_plural = 'timeline entries'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='posts_timelineentry_unique'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-created', '-post'),
+                name='posts_timeline_created_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='posts_timeline_author_idx'
+            ),
+        )
+
+
+class ImportedPost(models.Model):
+    """The post an ``import_posts`` record was stored as."""
+
+    source = models.CharField('Источник', max_length=255)
+    source_id = models.BigIntegerField('Id в источнике')
+    record = models.PositiveIntegerField('Номер записи')
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пост'
+    )
+
+    class Meta:
+        verbose_name = 'imported post'
+        verbose_name_plural = 'imported posts'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('source', 'source_id'),
+                name='posts_importedpost_unique'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.source}:{self.source_id} -> {self.post_id}'
+
+
+class ImportedComment(models.Model):
+    """The comment an ``import_posts`` record was stored as."""
+
+    source = models.CharField('Источник', max_length=255)
+    record = models.PositiveIntegerField('Номер записи')
+    comment = models.OneToOneField(
+        Comment,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Комментарий'
+    )
+
+    class Meta:
+        verbose_name = 'imported comment'
+        verbose_name_plural = 'imported comments'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('source', 'record'),
+                name='posts_importedcomment_unique'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.source}#{self.record} -> {self.comment_id}'
@@ -0,0 +1,109 @@
+"""Full-text search over ``Post.text`` backed by an SQLite FTS5 index.
+
+``posts_post_fts`` is an external-content FTS5 table over ``posts_post``
+kept in sync by triggers, so every write path, including ``bulk_create``
+and ``QuerySet.update``, reaches the index.
+"""
+from django.db import connection
+from django.db.models import FloatField, QuerySet, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+INSTALL_SQL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+    END""",
+)
+
+
+def is_supported(using=connection) -> bool:
+    return using.vendor == 'sqlite'
+
+
+def install_search_index(using=connection) -> None:
+    """Create the index and its triggers if they are missing.
+
+    Django rebuilds SQLite tables on most schema changes, which drops
+    their triggers, so this runs after every ``migrate``.
+    """
+    if not is_supported(using):
+        return
+    if Post._meta.db_table not in using.introspection.table_names():
+        return
+    with using.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+
+
+def rebuild_search_index(using=connection) -> None:
+    """Re-read every post into the index in one bulk pass."""
+    install_search_index(using)
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def to_match_query(text: str) -> str:
+    """Turn user input into an FTS5 query matching all of its words.
+
+    Every word is quoted, so FTS5 operators typed by the user are
+    searched for literally instead of raising syntax errors, and matched
+    as a prefix, so that "туман" also finds "тумане".
+    """
+    words = text.split()
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_posts(text: str, queryset: QuerySet = None) -> QuerySet:
+    """Return posts matching ``text`` annotated with a relevance ``score``.
+
+    A higher score means a better match.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    match = to_match_query(text)
+    if not match:
+        return queryset.none().annotate(
+            score=Value(0.0, output_field=FloatField()))
+    if not is_supported():
+        return queryset.filter(text__icontains=text).annotate(
+            score=Value(0.0, output_field=FloatField()))
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    ).annotate(
+        score=RawSQL(f'-bm25({FTS_TABLE})', (), output_field=FloatField())
+    )
+
+
+def matching_ids(text: str) -> RawSQL:
+    """Return a subquery of ids of posts matching ``text``."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (to_match_query(text),)
+    )
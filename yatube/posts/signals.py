@@ -0,0 +1,197 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import search, timelines
+from .cache import (author_card_feed, bump_feed_versions, comments_feed,
+                    group_card_feed, group_feed, groups_feed, index_feed,
+                    post_feeds, profile_feed)
+from .counters import (change_comments_count, change_followers_count,
+                       change_group_stats, change_posts_count,
+                       rename_group_stats_author)
+from .models import (Comment, Follow, Group, GroupStats, Post, TimelineEntry,
+                     User)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        change_posts_count(instance.author_id, 1)
+        return
+    old_author_id = instance.get_loaded_value('author_id')
+    if old_author_id != instance.author_id:
+        change_posts_count(old_author_id, -1)
+        change_posts_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_posts_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        change_comments_count(instance.post_id, 1)
+        return
+    old_post_id = instance.get_loaded_value('post_id')
+    if old_post_id != instance.post_id:
+        change_comments_count(old_post_id, -1)
+        change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_pages(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    feeds = post_feeds(instance, instance.get_loaded_value('group_id'))
+    old_author_id = instance.get_loaded_value('author_id')
+    if old_author_id != instance.author_id:
+        feeds.extend(
+            profile_feed(username) for username in User.objects.filter(
+                pk=old_author_id).values_list('username', flat=True)
+        )
+    bump_feed_versions(feeds)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance, **kwargs):
+    bump_feed_versions(post_feeds(instance))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_post_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # A comment moved to another post leaves the old one's pages too.
+    post_ids = {instance.post_id, instance.get_loaded_value('post_id')}
+    feeds = [comments_feed(post_id) for post_id in post_ids]
+    for post in Post.objects.select_related('author').filter(
+            pk__in=post_ids):
+        feeds.extend(post_feeds(post))
+    bump_feed_versions(feeds)
+
+
+@receiver(pre_save, sender=Group)
+def invalidate_renamed_group_pages(sender, instance, raw, **kwargs):
+    if instance.pk and not raw:
+        bump_feed_versions(
+            group_feed(slug) for slug in Group.objects.filter(
+                pk=instance.pk).values_list('slug', flat=True)
+        )
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_group_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_feed_versions([
+            index_feed(), groups_feed(), group_feed(instance.slug),
+            group_card_feed(instance.pk),
+            *(profile_feed(username) for username in User.objects.filter(
+                posts__group=instance).distinct().values_list(
+                    'username', flat=True)),
+        ])
+
+
+@receiver(pre_save, sender=User)
+def invalidate_renamed_author_pages(sender, instance, raw, update_fields,
+                                    **kwargs):
+    if instance.pk and not raw and update_fields != frozenset(['last_login']):
+        bump_feed_versions(
+            profile_feed(username) for username in User.objects.filter(
+                pk=instance.pk).values_list('username', flat=True)
+        )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_pages(sender, instance, created, raw, update_fields,
+                            **kwargs):
+    """Refresh the cards and pages showing a renamed author."""
+    if created or raw or update_fields == frozenset(['last_login']):
+        return
+    feeds = [
+        index_feed(), author_card_feed(instance.pk),
+        profile_feed(instance.username),
+        *(group_feed(slug) for slug in Group.objects.filter(
+            posts__author=instance).distinct().values_list(
+                'slug', flat=True)),
+    ]
+    if rename_group_stats_author(instance):
+        feeds.append(groups_feed())
+    bump_feed_versions(feeds)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_group_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old_group_id = None if created else instance.get_loaded_value('group_id')
+    if old_group_id and old_group_id != instance.group_id:
+        change_group_stats(old_group_id, -1)
+    if instance.group_id:
+        moved = created or old_group_id != instance.group_id
+        change_group_stats(instance.group_id, 1 if moved else 0)
+    if old_group_id or instance.group_id:
+        bump_feed_versions([groups_feed()])
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_group_post(sender, instance, **kwargs):
+    if instance.group_id:
+        change_group_stats(instance.group_id, -1)
+        bump_feed_versions([groups_feed()])
+
+
+@receiver(post_save, sender=Post)
+def fan_out_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        timelines.fan_out(instance)
+    elif instance.get_loaded_value('author_id') != instance.author_id:
+        TimelineEntry.objects.filter(post=instance).delete()
+        timelines.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_followers_count(instance.author_id, 1)
+        timelines.update_fan_out(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def forget_deleted_follow(sender, instance, **kwargs):
+    change_followers_count(instance.author_id, -1)
+    timelines.update_fan_out(instance.author_id)
+    TimelineEntry.objects.filter(
+        user_id=instance.user_id, author_id=instance.author_id).delete()
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_follow_pages(sender, instance, raw=False, **kwargs):
+    # The profile page shows its visitor whether they follow the author.
+    if not raw:
+        bump_feed_versions(
+            profile_feed(username) for username in User.objects.filter(
+                pk=instance.author_id).values_list('username', flat=True)
+        )
+
+
+def install_search_index(sender, using, **kwargs):
+    search.install_search_index(connections[using])
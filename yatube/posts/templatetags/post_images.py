@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+from django import template
+from django.conf import settings
+
+from posts.images import FORMAT_TYPES
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/posts/picture.html')
+def post_picture(post):
+    """Render the post image as a ``<picture>`` of its width variants.
+
+    Variants of a replaced image are ignored; until new ones are made
+    the regular thumbnail is shown instead.
+    """
+    variants = defaultdict(list)
+    for variant in post.image_variants.all():
+        if variant.source == post.image.name:
+            variants[variant.format].append(variant)
+    formats = [image_format
+               for image_format in settings.POST_IMAGE_VARIANT_FORMATS
+               if image_format in variants]
+    if not formats:
+        return {'post': post}
+
+    def srcset(image_format):
+        return ', '.join(f'{variant.image.url} {variant.width}w'
+                         for variant in variants[image_format])
+
+    fallback = variants[formats[-1]][-1]
+    return {
+        'post': post,
+        'sources': [
+            {'type': FORMAT_TYPES[image_format],
+             'srcset': srcset(image_format)}
+            for image_format in formats[:-1]
+        ],
+        'fallback': fallback,
+        'fallback_srcset': srcset(formats[-1]),
+        'sizes': settings.POST_IMAGE_SIZES,
+    }
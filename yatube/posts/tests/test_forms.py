@@ -1,3 +1,4 @@
+import io
 import shutil
 import tempfile
 
@@ -6,7 +7,9 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
+from posts.forms import PostForm
 from posts.models import Post, Comment
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -208,3 +211,82 @@ class PostFormTests(TestCase):
                 post=post
             ).exists()
         )
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POST_IMAGE_MAX_SIZE=32,
+    POST_IMAGE_FORMAT='WEBP',
+)
+class PostImageIngestTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='PostImageIngestTests')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def make_upload(self, size=(64, 48), name='photo.jpg', **options):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', **options)
+        return SimpleUploadedFile(
+            name=name,
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+
+    def ingest(self, upload):
+        form = PostForm({'text': 'ingest'}, {'image': upload})
+        form.is_valid()
+        return form
+
+    def test_image_is_reduced_and_reencoded(self):
+        """Картинка уменьшается и перекодируется в заданный формат."""
+        form = self.ingest(self.make_upload())
+        form.instance.author = self.user
+        post = form.save()
+
+        self.assertTrue(post.image.name.endswith('photo.webp'))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (32, 24))
+
+    def test_metadata_is_stripped(self):
+        """Метаданные EXIF не сохраняются."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        exif[0x0112] = 6
+        form = self.ingest(self.make_upload(exif=exif.tobytes()))
+
+        image = Image.open(form.cleaned_data['image'])
+        self.assertEqual(dict(image.getexif()), {})
+        self.assertEqual(image.size, (24, 32))
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels(self):
+        """Картинка больше лимита пикселей отклоняется."""
+        form = self.ingest(self.make_upload())
+
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'image_too_large')
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_too_large_upload(self):
+        """Слишком большой файл не создаёт пост."""
+        posts_count = Post.objects.count()
+
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'too large', 'image': self.make_upload()}
+        )
+
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 0 МБ.')
+        self.assertEqual(Post.objects.count(), posts_count)
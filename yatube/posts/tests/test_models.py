@@ -1,7 +1,15 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
-from posts.models import Post, Group
+from posts.importing import Checkpoint, Importer, read_records
+from posts.models import AuthorStats, Comment, Post, Group, GroupStats
 
 
 User = get_user_model()
@@ -96,3 +104,334 @@ class GroupModelTest(TestCase):
             with self.subTest(value=value):
                 self.assertEqual(
                     group._meta.get_field(value).help_text, expected)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='CountersTest')
+        cls.another_user = User.objects.create_user(
+            username='CountersTest_another_user')
+        cls.post = Post.objects.create(text='тест', author=cls.user)
+
+    def test_posts_count_follows_create_and_delete(self):
+        """Счётчик постов автора меняется при создании и удалении поста."""
+        post = Post.objects.create(text='ещё пост', author=self.user)
+        self.assertEqual(self.user.posts.count(), 2)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).posts_count, 2)
+
+        post.delete()
+
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).posts_count, 1)
+
+    def test_posts_count_moves_with_author_change(self):
+        """При смене автора пост переходит в счётчик нового автора."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.author = self.another_user
+        post.save()
+
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).posts_count, 0)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.another_user).posts_count, 1)
+
+    def test_comments_count_follows_create_and_delete(self):
+        """Счётчик комментариев поста меняется вместе с комментариями."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='комментарий')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        comment.delete()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_comments_count_moves_with_post_change(self):
+        """Перенесённый комментарий переходит в счётчик нового поста."""
+        other_post = Post.objects.create(text='другой', author=self.user)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='комментарий')
+        comment = Comment.objects.get()
+        comment.post = other_post
+        comment.save()
+
+        self.post.refresh_from_db()
+        other_post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(other_post.comments_count, 1)
+
+    def test_repair_counters_fixes_drift(self):
+        """Команда repair_counters восстанавливает испорченные счётчики."""
+        Comment.objects.create(
+            post=self.post, author=self.user, text='комментарий')
+        AuthorStats.objects.filter(author=self.user).update(posts_count=7)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=0)
+
+        call_command('repair_counters', batch_size=1, stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).posts_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.another_user).posts_count, 0)
+
+
+class GroupStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='GroupStatsTest')
+        cls.group = Group.objects.create(
+            title='first', slug='first', description='')
+        cls.another_group = Group.objects.create(
+            title='second', slug='second', description='')
+        cls.older = Post.objects.create(
+            text='older post', author=cls.user, group=cls.group)
+        cls.post = Post.objects.create(
+            text='newest post', author=cls.user, group=cls.group)
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_stats_follow_new_posts(self):
+        """Статистика группы учитывает новый пост."""
+        stats = self.stats(self.group)
+
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.last_post, self.post)
+        self.assertEqual(stats.last_activity, self.post.created)
+        self.assertEqual(stats.last_post_text, 'newest post')
+        self.assertEqual(stats.last_post_author, 'GroupStatsTest')
+        self.assertEqual(self.stats(self.another_group).posts_count, 0)
+
+    def test_stats_follow_edit_and_delete(self):
+        """Правка и удаление последнего поста меняют статистику."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'edited post'
+        post.save()
+        self.assertEqual(self.stats(self.group).last_post_text, 'edited post')
+
+        post.delete()
+
+        stats = self.stats(self.group)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.last_post, self.older)
+        self.assertEqual(stats.last_post_text, 'older post')
+
+    def test_stats_follow_admin_group_change(self):
+        """Смена группы в списке постов админки переносит пост."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+        self.client.post('/admin/posts/post/', {
+            'form-TOTAL_FORMS': 1,
+            'form-INITIAL_FORMS': 1,
+            'form-0-id': self.post.id,
+            'form-0-group': self.another_group.id,
+            '_save': 'Сохранить',
+        })
+
+        self.assertEqual(self.stats(self.group).posts_count, 1)
+        self.assertEqual(self.stats(self.group).last_post, self.older)
+        self.assertEqual(self.stats(self.another_group).posts_count, 1)
+        self.assertEqual(
+            self.stats(self.another_group).last_post_text, 'newest post')
+
+    def test_rebuild_group_stats(self):
+        """Команда rebuild_group_stats восстанавливает статистику групп."""
+        GroupStats.objects.filter(group=self.group).update(
+            posts_count=7, last_post=None, last_post_text='')
+        GroupStats.objects.filter(group=self.another_group).delete()
+
+        call_command('rebuild_group_stats', batch_size=1, stdout=StringIO())
+
+        stats = self.stats(self.group)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.last_post, self.post)
+        self.assertEqual(self.stats(self.another_group).posts_count, 0)
+
+
+class SeedCommandTest(TestCase):
+    def seed(self):
+        call_command(
+            'seed_yatube',
+            users=5,
+            groups=2,
+            posts=30,
+            comments=60,
+            batch_size=7,
+            stdout=StringIO()
+        )
+
+    def test_seed_fills_tables_and_counters(self):
+        """Команда seed_yatube заполняет таблицы и счётчики."""
+        self.seed()
+
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 60)
+        self.assertEqual(
+            sum(AuthorStats.objects.values_list('posts_count', flat=True)),
+            30)
+        self.assertEqual(
+            sum(Post.objects.values_list('comments_count', flat=True)), 60)
+        self.assertEqual(
+            list(Post.objects.order_by('id').values_list('id', flat=True)),
+            list(Post.objects.order_by('created').values_list(
+                'id', flat=True))
+        )
+
+    def test_seed_is_deterministic(self):
+        """С одним и тем же seed команда создаёт одинаковые посты."""
+        self.seed()
+        self.seed()
+
+        texts = list(Post.objects.order_by('id').values_list(
+            'text', flat=True))
+        self.assertEqual(texts[:30], texts[30:])
+
+
+class ImportPostsTest(TestCase):
+    RECORDS = (
+        {'type': 'post', 'id': 10, 'author': 'importer', 'group': 'old',
+         'text': 'первый пост', 'created': '2019-05-01T12:00:00+00:00'},
+        {'type': 'comment', 'post': 10, 'author': 'reader',
+         'text': 'первый комментарий'},
+        'not json',
+        {'type': 'post', 'id': 11, 'author': 'newcomer', 'group': 'new',
+         'text': 'второй пост'},
+        {'type': 'comment', 'post': 99, 'author': 'reader',
+         'text': 'комментарий к чужому посту'},
+        {'type': 'comment', 'post': 11, 'author': 'importer',
+         'text': 'второй комментарий'},
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='importer')
+        cls.group = Group.objects.create(
+            title='old', slug='old', description='')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'posts.jsonl')
+        with open(self.path, 'w') as file:
+            for record in self.RECORDS:
+                if isinstance(record, dict):
+                    record = json.dumps(record, ensure_ascii=False)
+                file.write(record + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def import_posts(self, path=None):
+        stderr = StringIO()
+        call_command('import_posts', path or self.path, batch_size=2,
+                     stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def checkpoint(self):
+        with open(self.path + '.checkpoint') as file:
+            return json.load(file)
+
+    def test_import_jsonl(self):
+        """Команда import_posts загружает посты и комментарии."""
+        errors = self.import_posts()
+
+        first = Post.objects.get(text='первый пост')
+        second = Post.objects.get(text='второй пост')
+        self.assertEqual(first.author, self.user)
+        self.assertEqual(first.group, self.group)
+        self.assertEqual(first.created.year, 2019)
+        self.assertEqual(second.author.username, 'newcomer')
+        self.assertEqual(second.group.slug, 'new')
+        self.assertEqual(
+            list(first.comments.values_list('author__username', flat=True)),
+            ['reader'])
+        self.assertEqual(first.comments_count, 1)
+        second.refresh_from_db()
+        self.assertEqual(second.comments_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user).posts_count, 1)
+        self.assertEqual(self.checkpoint()['skipped'], 2)
+        self.assertEqual(self.checkpoint()['orphans'], 1)
+        self.assertIn('Запись 3 пропущена', errors)
+        self.assertIn('Запись 5 пропущена: unknown post', errors)
+
+    def test_replayed_batches_are_not_duplicated(self):
+        """Повторный прогон с контрольной точки не создаёт дублей."""
+        self.import_posts()
+        checkpoint = self.checkpoint()
+        checkpoint['records'] = 2
+        with open(self.path + '.checkpoint', 'w') as file:
+            json.dump(checkpoint, file)
+
+        self.import_posts()
+
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_resume_from_checkpoint(self):
+        """Импорт продолжается с записи после контрольной точки."""
+        with open(self.path + '.checkpoint', 'w') as file:
+            json.dump({'records': 2}, file)
+
+        self.import_posts()
+
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)),
+            ['второй пост'])
+
+    def test_live_posts_during_import(self):
+        """Посты, созданные во время импорта, не мешают ему."""
+        importer = Importer(Checkpoint(self.path + '.checkpoint'), 2,
+                            lambda number, reason: None, 'posts')
+        with open(self.path) as file:
+            batches = importer.run(read_records(file, 'jsonl'))
+            next(batches)
+            live = Post.objects.create(text='живой пост', author=self.user)
+            Comment.objects.create(post=live, author=self.user, text='живой')
+            checkpoint = list(batches)[-1]
+
+        second = Post.objects.get(text='второй пост')
+        self.assertEqual(
+            list(second.comments.values_list('text', flat=True)),
+            ['второй комментарий'])
+        self.assertEqual(
+            list(live.comments.values_list('text', flat=True)), ['живой'])
+        self.assertEqual(
+            (checkpoint.posts, checkpoint.comments, checkpoint.skipped),
+            (2, 2, 2))
+
+    def test_replayed_batch_counts_once(self):
+        """Повторенная после сбоя пачка не увеличивает итоги дважды."""
+        self.import_posts()
+        expected = self.checkpoint()
+        replayed = dict(expected, records=2, posts=1, comments=1,
+                        orphans=0)
+        with open(self.path + '.checkpoint', 'w') as file:
+            json.dump(replayed, file)
+
+        self.import_posts()
+
+        self.assertEqual(self.checkpoint(), expected)
+
+    def test_import_csv(self):
+        """Команда import_posts читает CSV с заголовком."""
+        path = os.path.join(self.directory, 'posts.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('type,id,post,author,group,text,created\n'
+                       'post,1,,importer,,"пост, из CSV",\n'
+                       'comment,,1,importer,,комментарий,\n')
+
+        self.import_posts(path)
+
+        post = Post.objects.get()
+        self.assertEqual(post.text, 'пост, из CSV')
+        self.assertIsNone(post.group)
+        self.assertEqual(post.comments.get().text, 'комментарий')
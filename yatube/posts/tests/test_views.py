@@ -1,14 +1,34 @@
+import io
+import json
+import re
 import shutil
 import tempfile
+from http import HTTPStatus
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-from django.test import TestCase, Client, override_settings
+from django.test import (TestCase, TransactionTestCase, Client,
+                         override_settings)
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django import forms
+from django.contrib import admin
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 
-from posts.models import Group, Post, Comment
+from core.testing import QueryBudgetMixin
+from core.writes import WriteTimeout
+from posts.admin import PostAdmin
+from posts.images import variant_formats
+from posts.models import (AuthorStats, Group, GroupStats, Post, Comment,
+                          Follow, PostImageVariant, TimelineEntry)
+from posts import estimates, thumbnails, timelines
+from posts.utils import KeysetPaginator
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -189,6 +209,24 @@ class PostPagesTests(TestCase):
                 form_field = response.context.get('form').fields.get(value)
                 self.assertIsInstance(form_field, expected)
 
+    def test_dropped_writes_ask_to_retry(self):
+        """Не принятая потоком записи форма отвечает 503 с Retry-After."""
+        requests = (
+            (reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+             {'text': 'comment'}),
+            (reverse('posts:post_create'), {'text': 'new post'}),
+        )
+        for url, data in requests:
+            with self.subTest(url=url):
+                with mock.patch('posts.views.run_write',
+                                side_effect=WriteTimeout):
+                    response = self.authorized_client.post(url, data)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.SERVICE_UNAVAILABLE)
+                self.assertEqual(response['Retry-After'],
+                                 str(settings.WRITE_RETRY_AFTER))
+                self.assertTemplateUsed(response, 'core/503.html')
+
     def test_created_comment_is_displayed(self):
         """Созданный комментарий отображается на шаблоне post_detail."""
         new_comment = Comment.objects.create(
@@ -265,6 +303,323 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(
                     len(response.context['page_obj']), posts_on_second_page)
 
+    def test_cursor_pages_cover_all_posts(self):
+        """
+        Курсоры ?after= и ?before= обходят ленту без пропусков и повторов.
+        """
+        first_page = self.authorized_client.get(
+            self.INDEX_URL).context['page_obj']
+        second_page = self.authorized_client.get(
+            self.INDEX_URL, {'after': first_page.next_cursor}
+        ).context['page_obj']
+        back_page = self.authorized_client.get(
+            self.INDEX_URL, {'before': second_page.previous_cursor}
+        ).context['page_obj']
+
+        expected = list(Post.objects.order_by('-created', '-id'))
+        self.assertEqual(list(first_page) + list(second_page), expected)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertFalse(back_page.has_previous())
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.authorized_client.get(
+            self.INDEX_URL, {'after': 'not-a-cursor'})
+
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_PER_PAGE)
+
+    def test_paginator_does_not_count_posts(self):
+        """Страница ленты не выполняет COUNT по таблице постов."""
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(self.INDEX_URL)
+
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_page_window_from_stored_counts(self):
+        """Номера страниц группы и профиля берутся из счётчиков."""
+        for url in (self.GROUP_POSTS, self.PROFILE_URL):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(url)
+
+                self.assertEqual(
+                    list(response.context['page_obj'].page_window()), [1, 2])
+                self.assertContains(response, '?page=2')
+                self.assertFalse(
+                    [q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_page_window(self):
+        """Окно страниц держится оценки и известных соседей."""
+        posts = Post.objects.all()
+        per_page = 2
+        expected = {
+            # (count, page): window
+            (None, 1): [1, 2],
+            (15, 1): [1, 2, 3],
+            (15, 5): [3, 4, 5, 6, 7],
+            (2, 3): [1, 2, 3, 4],
+            (100, 8): [6, 7, 8],
+        }
+        for (count, number), window in expected.items():
+            with self.subTest(count=count, number=number):
+                page = KeysetPaginator(
+                    posts, per_page, count=count).get_page(number)
+                self.assertEqual(list(page.page_window()), window)
+        paginator = KeysetPaginator(posts, per_page, count=15)
+        cursor_page = paginator.get_page(
+            after=paginator.get_page(1).next_cursor)
+        self.assertEqual(list(cursor_page.page_window()), [])
+
+    @override_settings(PAGE_NUMBER_LIMIT=2)
+    def test_page_number_limit(self):
+        """Страницы глубже лимита доступны только по курсору."""
+        page = KeysetPaginator(
+            Post.objects.all(), 2, count=15).get_page(2)
+        self.assertEqual(list(page.page_window()), [1, 2])
+
+        response = self.authorized_client.get(self.INDEX_URL, {'page': 3})
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='PageCacheTest')
+        cls.group = Group.objects.create(
+            title='first group',
+            slug='page-cache-first',
+            description='test description'
+        )
+        cls.another_group = Group.objects.create(
+            title='second group',
+            slug='page-cache-second',
+            description='test description'
+        )
+        cls.post = Post.objects.create(
+            text='cached post',
+            author=cls.user,
+            group=cls.group
+        )
+        cls.urls = {
+            'index': reverse('posts:index'),
+            'group_posts': reverse(
+                'posts:group_posts', kwargs={'slug': cls.group.slug}),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': cls.user.username}),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_guest_pages_are_cached(self):
+        """Повторный запрос гостя отдаётся из кеша без запросов к БД."""
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                first = self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.guest_client.get(url)
+                self.assertEqual(first.content, second.content)
+
+    def test_new_post_invalidates_pages(self):
+        """Новый пост сбрасывает кеш ленты, группы и профиля."""
+        for url in self.urls.values():
+            self.guest_client.get(url)
+
+        Post.objects.create(
+            text='brand new post', author=self.user, group=self.group)
+
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'brand new post')
+
+    def test_group_change_invalidates_both_groups(self):
+        """Смена группы поста сбрасывает кеш старой и новой группы."""
+        old_url = self.urls['group_posts']
+        new_url = reverse(
+            'posts:group_posts', kwargs={'slug': self.another_group.slug})
+        self.guest_client.get(old_url)
+        self.guest_client.get(new_url)
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.another_group
+        post.save()
+
+        self.assertNotContains(self.guest_client.get(old_url), 'cached post')
+        self.assertContains(self.guest_client.get(new_url), 'cached post')
+
+    def test_authorized_pages_are_not_cached(self):
+        """Авторизованный пользователь всегда получает свежую страницу."""
+        self.authorized_client.get(self.urls['index'])
+
+        response = self.authorized_client.get(self.urls['index'])
+
+        self.assertIsNotNone(response.context)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='PostCardCacheTest')
+        cls.post = Post.objects.create(text='card text', author=cls.user)
+        cls.INDEX_URL = reverse('posts:index')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_cached_cards_are_not_rendered_again(self):
+        """Карточка поста берётся из кеша при повторном показе ленты."""
+        first = self.authorized_client.get(self.INDEX_URL)
+        second = self.authorized_client.get(self.INDEX_URL)
+
+        self.assertTemplateUsed(first, 'includes/posts/card.html')
+        self.assertTemplateNotUsed(second, 'includes/posts/card.html')
+        self.assertContains(second, 'card text')
+
+    def test_post_edit_refreshes_card(self):
+        """Редактирование поста сбрасывает его карточку."""
+        self.authorized_client.get(self.INDEX_URL)
+
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'edited card text'}
+        )
+        response = self.authorized_client.get(self.INDEX_URL)
+
+        self.assertContains(response, 'edited card text')
+
+    def test_comment_keeps_card(self):
+        """Новый комментарий не сбрасывает карточку поста."""
+        self.authorized_client.get(self.INDEX_URL)
+
+        Comment.objects.create(
+            post=self.post, author=self.user, text='comment')
+        response = self.authorized_client.get(self.INDEX_URL)
+
+        self.assertTemplateNotUsed(response, 'includes/posts/card.html')
+
+    def test_author_and_group_changes_refresh_card(self):
+        """Переименование автора или группы сбрасывает карточку."""
+        group = Group.objects.create(
+            title='card group', slug='card-group', description='')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        self.authorized_client.get(self.INDEX_URL)
+
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        group.slug = 'renamed-group'
+        group.save()
+        response = self.authorized_client.get(self.INDEX_URL)
+
+        self.assertContains(response, 'Renamed')
+        self.assertContains(response, '/group/renamed-group/')
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='SearchViewsTest')
+        cls.another_user = User.objects.create_user(
+            username='SearchViewsTest_another_user')
+        cls.group = Group.objects.create(
+            title='search group',
+            slug='search-group',
+            description='test description'
+        )
+        cls.best_post = Post.objects.create(
+            text='ёжик ежик в тумане', author=cls.user, group=cls.group)
+        cls.post = Post.objects.create(
+            text='ёжик и лошадь в тумане', author=cls.another_user)
+        Post.objects.create(text='про другое', author=cls.user)
+        cls.SEARCH_URL = reverse('posts:search')
+        cls.SEARCH_API_URL = reverse('posts:search_api')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_search_ranks_matches(self):
+        """Поиск находит посты по словам и ставит лучшие выше."""
+        response = self.guest_client.get(self.SEARCH_URL, {'q': 'ёжик'})
+
+        self.assertEqual(
+            list(response.context['page_obj']), [self.best_post, self.post])
+
+    def test_search_filters(self):
+        """Поиск фильтрует результаты по автору и группе."""
+        filters = {
+            'author': {'author': self.another_user.username},
+            'group': {'group': self.group.slug},
+        }
+        expected = {'author': [self.post], 'group': [self.best_post]}
+        for name, params in filters.items():
+            with self.subTest(name=name):
+                response = self.guest_client.get(
+                    self.SEARCH_URL, {'q': 'туман', **params})
+                self.assertEqual(
+                    list(response.context['page_obj']), expected[name])
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        post = Post.objects.create(text='первая версия', author=self.user)
+        post.text = 'вторая версия'
+        post.save()
+
+        found = self.guest_client.get(self.SEARCH_API_URL, {'q': 'вторая'})
+        self.assertEqual(
+            [item['id'] for item in found.json()['results']], [post.id])
+        self.assertEqual(self.guest_client.get(
+            self.SEARCH_API_URL, {'q': 'первая'}).json()['results'], [])
+
+        post.delete()
+
+        self.assertEqual(self.guest_client.get(
+            self.SEARCH_API_URL, {'q': 'вторая'}).json()['results'], [])
+
+    def test_search_pages_by_cursor(self):
+        """Курсор API ведёт на следующую страницу результатов."""
+        for number in range(settings.POSTS_PER_PAGE):
+            Post.objects.create(text=f'туман {number}', author=self.user)
+
+        first = self.guest_client.get(
+            self.SEARCH_API_URL, {'q': 'туман'}).json()
+        second = self.guest_client.get(
+            self.SEARCH_API_URL, {'q': 'туман', 'after': first['next']}
+        ).json()
+
+        ids = [item['id'] for item in first['results'] + second['results']]
+        self.assertEqual(len(ids), settings.POSTS_PER_PAGE + 2)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertIsNone(second['next'])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты через полнотекстовый индекс."""
+        post_admin = PostAdmin(Post, admin.site)
+
+        queryset, _ = post_admin.get_search_results(
+            None, Post.objects.all(), 'лошадь')
+
+        self.assertEqual(list(queryset), [self.post])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Спецсимволы FTS в запросе не ломают поиск."""
+        response = self.guest_client.get(
+            self.SEARCH_URL, {'q': 'ежик" OR (NEAR'})
+
+        self.assertEqual(response.status_code, 200)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostImageViewsTest(TestCase):
@@ -331,3 +686,861 @@ class PostImageViewsTest(TestCase):
                 page_obj = response.context.get('page_obj', [None])
                 post = page_obj[0] or response.context.get('post')
                 self.assertIsNotNone(post.image)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='PostThumbnailTest')
+        cls.small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            text='thumbnail text',
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name='thumbnail.gif',
+                content=cls.small_gif,
+                content_type='image/gif'
+            )
+        )
+        cls.INDEX_URL = reverse('posts:index')
+        cls.POST_DETAIL_URL = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': cls.post.id}
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def generate_thumbnails(self):
+        for geometry_string, options in thumbnails.POST_THUMBNAILS:
+            thumbnails._generate(
+                self.post.image.name, geometry_string, dict(options))
+
+    def test_pending_thumbnail_shows_placeholder(self):
+        """Пока миниатюры нет, вместо неё показывается заглушка."""
+        for url in (self.INDEX_URL, self.POST_DETAIL_URL):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'img/placeholder.svg')
+
+    def test_pending_thumbnail_card_is_not_cached(self):
+        """Карточка с заглушкой не попадает в кеш."""
+        self.authorized_client.get(self.INDEX_URL)
+        response = self.authorized_client.get(self.INDEX_URL)
+
+        self.assertTemplateUsed(response, 'includes/posts/card.html')
+
+    def test_generated_thumbnail_is_shown(self):
+        """Готовая миниатюра показывается вместо заглушки."""
+        self.generate_thumbnails()
+
+        for url in (self.INDEX_URL, self.POST_DETAIL_URL):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertNotContains(response, 'img/placeholder.svg')
+                self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_post_create_queues_thumbnails(self):
+        """Создание поста с картинкой ставит миниатюры в очередь."""
+        with mock.patch.object(thumbnails, 'schedule_thumbnail') as schedule:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': 'new thumbnail text',
+                    'image': SimpleUploadedFile(
+                        name='new_thumbnail.gif',
+                        content=self.small_gif,
+                        content_type='image/gif'
+                    ),
+                }
+            )
+
+        post = Post.objects.get(text='new thumbnail text')
+        for geometry_string, options in thumbnails.POST_THUMBNAILS:
+            schedule.assert_any_call(
+                post.image.name, geometry_string, options)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageVariantTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='PostImageVariantTest')
+        cls.post = Post.objects.create(
+            text='variant text',
+            author=cls.user,
+            image=cls.make_upload('variant.jpg')
+        )
+        cls.INDEX_URL = reverse('posts:index')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def make_upload(name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (700, 400), 'blue').save(buffer, 'JPEG')
+        return SimpleUploadedFile(
+            name=name,
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def generate_variants(self):
+        call_command('generate_image_variants', stdout=io.StringIO())
+
+    def test_command_creates_variants(self):
+        """Команда создаёт варианты подходящей ширины во всех форматах."""
+        self.generate_variants()
+
+        variants = PostImageVariant.objects.filter(post=self.post)
+        self.assertEqual(
+            set(variants.values_list('format', 'width')),
+            {(image_format, width)
+             for image_format in variant_formats()
+             for width in (320, 480, 640)}
+        )
+        variant = variants.get(format='JPEG', width=640)
+        self.assertEqual(variant.height, 226)
+        with Image.open(variant.image) as image:
+            self.assertEqual(image.size, (640, 226))
+
+    def test_broken_images_are_skipped(self):
+        """Битые и слишком большие картинки не останавливают команду."""
+        upload = self.make_upload('truncated.jpg')
+        truncated = SimpleUploadedFile(
+            name='truncated.jpg', content=upload.read()[:300],
+            content_type='image/jpeg')
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 2000), 'blue').save(buffer, 'PNG')
+        bomb = SimpleUploadedFile(
+            name='bomb.png', content=buffer.getvalue(),
+            content_type='image/png')
+        for image in (truncated, bomb):
+            Post.objects.create(text='broken', author=self.user, image=image)
+        post = Post.objects.create(
+            text='after broken', author=self.user,
+            image=self.make_upload('after.jpg'))
+
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 700 * 400), \
+                self.assertLogs('posts.images', 'ERROR') as logs:
+            self.generate_variants()
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertTrue(
+            PostImageVariant.objects.filter(post=post).exists())
+        self.assertFalse(PostImageVariant.objects.filter(
+            post__text='broken').exists())
+
+    def test_feed_shows_picture_with_srcset(self):
+        """Лента показывает <picture> с srcset и ленивой загрузкой."""
+        self.guest_client.get(self.INDEX_URL)
+        self.generate_variants()
+
+        response = self.guest_client.get(self.INDEX_URL)
+
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '640w')
+        self.assertContains(response, 'width="640" height="226"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_replaced_image_falls_back_to_thumbnail(self):
+        """Варианты прежней картинки не показываются."""
+        self.generate_variants()
+        self.post.image = self.make_upload('replaced.jpg')
+        self.post.save()
+
+        response = self.guest_client.get(self.INDEX_URL)
+
+        self.assertNotContains(response, '<picture>')
+        self.assertContains(response, 'loading="lazy"')
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class CommentPaginationTest(TestCase):
+    COMMENTS_COUNT = 7
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='CommentPaginationTest')
+        cls.post = Post.objects.create(text='commented', author=cls.user)
+        cls.quiet_post = Post.objects.create(text='quiet', author=cls.user)
+        for number in range(cls.COMMENTS_COUNT):
+            commenter = User.objects.create_user(username=f'commenter{number}')
+            Comment.objects.create(
+                post=cls.post, author=commenter, text=f'comment {number}')
+        Comment.objects.create(
+            post=cls.quiet_post, author=cls.user, text='lonely comment')
+        cls.POST_DETAIL_URL = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.id})
+        cls.POST_COMMENTS_URL = reverse(
+            'posts:post_comments', kwargs={'post_id': cls.post.id})
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_post_detail_shows_first_comments_page(self):
+        """На странице поста первая страница комментариев, новые сверху."""
+        response = self.guest_client.get(self.POST_DETAIL_URL)
+
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'comment {number}' for number in range(6, 1, -1)]
+        )
+        self.assertContains(response, comments.next_cursor)
+
+    def test_comments_fragment_returns_next_page(self):
+        """Фрагмент по курсору возвращает следующие комментарии."""
+        response = self.guest_client.get(self.POST_DETAIL_URL)
+
+        fragment = self.guest_client.get(
+            self.POST_COMMENTS_URL,
+            {'after': response.context['comments'].next_cursor}
+        )
+
+        self.assertTemplateUsed(fragment, 'includes/posts/comments.html')
+        self.assertTemplateNotUsed(fragment, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in fragment.context['comments']],
+            ['comment 1', 'comment 0']
+        )
+        self.assertNotContains(fragment, 'data-fragment')
+
+    def test_comment_queries_do_not_grow_with_thread(self):
+        """Число запросов не зависит от числа комментариев."""
+        quiet_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.quiet_post.id})
+        with CaptureQueriesContext(connection) as quiet:
+            self.guest_client.get(quiet_url)
+        with CaptureQueriesContext(connection) as busy:
+            self.guest_client.get(self.POST_DETAIL_URL)
+
+        self.assertEqual(len(busy), len(quiet))
+
+    def test_comments_fragment_of_missing_post(self):
+        """Фрагмент несуществующего поста возвращает 404."""
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    COMMENTS_COUNT = 15
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='QueryBudgetTest')
+        cls.group = Group.objects.create(
+            title='QueryBudgetTest',
+            slug='query_budget_test',
+            description='description'
+        )
+        for number in range(settings.POSTS_PER_PAGE + 5):
+            cls.post = Post.objects.create(
+                text=f'budget {number}', author=cls.user, group=cls.group)
+        for number in range(cls.COMMENTS_COUNT):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'budget{number}'),
+                text=f'comment {number}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_views_stay_within_query_budget(self):
+        """Страницы укладываются в бюджет запросов к базе."""
+        budgets = {
+            reverse('posts:index'): 3,
+            reverse(
+                'posts:group_posts',
+                kwargs={'slug': self.group.slug}
+            ): 4,
+            reverse(
+                'posts:profile',
+                kwargs={'username': self.user.username}
+            ): 4,
+            reverse(
+                'posts:post_detail',
+                kwargs={'post_id': self.post.id}
+            ): 5,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url), self.assertQueryBudget(budget):
+                self.authorized_client.get(url)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='ConditionalGetTest')
+        cls.group = Group.objects.create(
+            title='conditional', slug='conditional', description='')
+        cls.post = Post.objects.create(
+            text='conditional', author=cls.user, group=cls.group)
+        cls.PAGE_URLS = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.id}),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_unchanged_page_is_not_modified(self):
+        """Неизменившаяся страница отвечает 304 почти без запросов."""
+        for url in self.PAGE_URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                # A post page reads its row, feeds only the cache.
+                with self.assertNumQueries(
+                        1 if 'posts/' in url else 0):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        """Страница отвечает 304 на If-Modified-Since."""
+        for url in self.PAGE_URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_changed_page_is_sent_again(self):
+        """После нового комментария страницы отдаются заново."""
+        etags = {url: self.client.get(url)['ETag']
+                 for url in self.PAGE_URLS}
+
+        Comment.objects.create(
+            post=self.post, author=self.user, text='changed')
+
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_visitor_and_page(self):
+        """ETag зависит от посетителя и параметров страницы."""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+
+        self.assertNotEqual(
+            self.authorized_client.get(url)['ETag'], etag)
+        self.assertNotEqual(self.client.get(url, {'page': 2})['ETag'], etag)
+
+    def test_last_modified_is_not_shared_across_login(self):
+        """Last-Modified анонимной страницы не даёт 304 после входа."""
+        for url in self.PAGE_URLS:
+            with self.subTest(url=url):
+                anonymous = self.client.get(url)
+                response = self.authorized_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=anonymous['Last-Modified'])
+
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Last-Modified'))
+                self.assertIn('Cookie', response['Vary'])
+                self.assertIn('Cookie', anonymous['Vary'])
+
+    def test_comment_edit_changes_post_page(self):
+        """Правка комментария меняет ETag страницы поста."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='first')
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag = self.client.get(url)['ETag']
+
+        comment.text = 'edited'
+        comment.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'edited')
+
+    def test_missing_post_has_no_validators(self):
+        """Несуществующий пост не получает ETag."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 0}))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ProfileExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='ProfileExportTest')
+        cls.another_user = User.objects.create_user(username='another')
+        cls.group = Group.objects.create(
+            title='export', slug='export', description='')
+        cls.post = Post.objects.create(
+            text='exported post', author=cls.user, group=cls.group)
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.user, text='exported comment')
+        foreign_post = Post.objects.create(
+            text='foreign post', author=cls.another_user)
+        Comment.objects.create(
+            post=foreign_post, author=cls.user, text='foreign comment')
+        cls.EXPORT_URL = reverse(
+            'posts:profile_export', kwargs={'username': cls.user.username})
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_export_jsonl(self):
+        """Автор скачивает свои посты и комментарии в JSONL."""
+        response = self.authorized_client.get(self.EXPORT_URL)
+
+        self.assertTrue(response.streaming)
+        self.assertIn('ProfileExportTest.jsonl',
+                      response['Content-Disposition'])
+        records = [json.loads(line) for line in
+                   b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [(record['type'], record['text']) for record in records],
+            [('post', 'exported post'), ('comment', 'exported comment'),
+             ('comment', 'foreign comment')]
+        )
+        self.assertEqual(records[0]['group'], 'export')
+        self.assertEqual(records[1]['post'], self.post.id)
+
+    def test_export_csv(self):
+        """Выгрузка в CSV начинается с заголовка."""
+        response = self.authorized_client.get(
+            self.EXPORT_URL, {'format': 'csv'})
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'type,id,post,author,group,text,created')
+        self.assertEqual(len(lines), 4)
+
+    def test_export_can_be_imported(self):
+        """Выгрузка загружается обратно; комментарии к чужим постам
+        считаются отдельно."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/export.jsonl'
+        call_command('export_posts', self.user.username, output=path)
+        Post.objects.filter(author=self.user).delete()
+        Comment.objects.filter(author=self.user).delete()
+
+        stdout = io.StringIO()
+        call_command('import_posts', path, stdout=stdout,
+                     stderr=io.StringIO())
+
+        self.assertIn('из них без поста в импорте: 1', stdout.getvalue())
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 1)
+        self.assertEqual(
+            list(Comment.objects.filter(author=self.user)
+                 .values_list('text', flat=True)),
+            ['exported comment']
+        )
+
+    def test_export_is_private(self):
+        """Чужую выгрузку скачать нельзя."""
+        client = Client()
+        client.force_login(self.another_user)
+
+        response = client.get(self.EXPORT_URL)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_unknown_format(self):
+        """Неизвестный формат выгрузки возвращает 400."""
+        response = self.authorized_client.get(
+            self.EXPORT_URL, {'format': 'xml'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_command_matches_view(self):
+        """Команда export_posts выгружает то же, что и страница."""
+        stdout = io.StringIO()
+        call_command('export_posts', self.user.username, stdout=stdout)
+
+        response = self.authorized_client.get(self.EXPORT_URL)
+        self.assertEqual(
+            stdout.getvalue(),
+            b''.join(response.streaming_content).decode()
+        )
+
+
+class FollowTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.popular = User.objects.create_user(username='popular')
+        self.stranger = User.objects.create_user(username='stranger')
+        self.client.force_login(self.reader)
+        self.FOLLOW_URL = reverse('posts:follow_index')
+
+    def follow(self, author):
+        return self.client.post(reverse(
+            'posts:profile_follow', kwargs={'username': author.username}))
+
+    def unfollow(self, author):
+        return self.client.post(reverse(
+            'posts:profile_unfollow', kwargs={'username': author.username}))
+
+    def feed_texts(self, **params):
+        response = self.client.get(self.FOLLOW_URL, params)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_follow_and_unfollow(self):
+        """Подписка и отписка меняют подписки и счётчик подписчиков."""
+        self.follow(self.author)
+        self.follow(self.author)
+        self.follow(self.reader)
+
+        self.assertEqual(
+            list(Follow.objects.values_list('user', 'author')),
+            [(self.reader.id, self.author.id)]
+        )
+        self.assertEqual(self.author.stats.followers_count, 1)
+
+        self.unfollow(self.author)
+
+        self.assertFalse(Follow.objects.exists())
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 0)
+
+    def test_follow_needs_post(self):
+        """Подписаться можно только POST-запросом."""
+        response = self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}))
+
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_profile_shows_follow_state(self):
+        """Профиль показывает, подписан ли посетитель на автора."""
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertFalse(self.client.get(url).context['following'])
+
+        self.follow(self.author)
+
+        self.assertTrue(self.client.get(url).context['following'])
+
+    def test_feed_shows_followed_authors(self):
+        """В ленте подписок есть посты только избранных авторов."""
+        Post.objects.create(text='before follow', author=self.author)
+        self.follow(self.author)
+        Post.objects.create(text='after follow', author=self.author)
+        Post.objects.create(text='stranger post', author=self.stranger)
+
+        self.assertEqual(self.feed_texts(), ['after follow', 'before follow'])
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+
+        self.unfollow(self.author)
+
+        self.assertEqual(self.feed_texts(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_popular_authors_are_read_on_demand(self):
+        """Посты популярных авторов подмешиваются в ленту при чтении."""
+        self.follow(self.author)
+        self.follow(self.popular)
+        with self.settings(FOLLOW_FANOUT_LIMIT=1):
+            Follow.objects.create(user=self.stranger, author=self.popular)
+            for number in range(settings.POSTS_PER_PAGE):
+                Post.objects.create(text=f'author {number}',
+                                    author=self.author)
+                Post.objects.create(text=f'popular {number}',
+                                    author=self.popular)
+
+            self.assertFalse(TimelineEntry.objects.filter(
+                author=self.popular).exists())
+            response = self.client.get(self.FOLLOW_URL)
+            page_obj = response.context['page_obj']
+            texts = [post.text for post in page_obj]
+            texts += self.feed_texts(after=page_obj.next_cursor)
+
+        expected = []
+        for number in reversed(range(settings.POSTS_PER_PAGE)):
+            expected += [f'popular {number}', f'author {number}']
+        self.assertEqual(texts, expected)
+
+    def test_author_back_under_fanout_limit(self):
+        """Посты, написанные сверх лимита рассылки, не пропадают из
+        ленты, когда автор возвращается под лимит с запасом."""
+        self.follow(self.popular)
+        Follow.objects.create(user=self.stranger, author=self.popular)
+        immediately = mock.patch('posts.timelines.transaction.on_commit',
+                                 side_effect=lambda callback: callback())
+        schedule = mock.patch('posts.timelines.schedule_resume')
+        with self.settings(FOLLOW_FANOUT_LIMIT=2, FOLLOW_FANOUT_MARGIN=1), \
+                immediately, schedule as schedule_mock:
+            Follow.objects.create(user=self.author, author=self.popular)
+            Post.objects.create(text='popular post', author=self.popular)
+            self.assertFalse(TimelineEntry.objects.exists())
+
+            # Toggling a follow at the limit leaves the author alone.
+            for _ in range(2):
+                Follow.objects.get(user=self.author).delete()
+                Follow.objects.create(user=self.author, author=self.popular)
+            Follow.objects.get(user=self.author).delete()
+            schedule_mock.assert_not_called()
+            self.assertEqual(self.feed_texts(), ['popular post'])
+
+            Follow.objects.get(user=self.stranger).delete()
+            schedule_mock.assert_called_once_with(self.popular.id)
+
+            self.assertTrue(timelines.resume_fan_out(self.popular.id))
+            Post.objects.create(text='later post', author=self.popular)
+
+        self.assertTrue(AuthorStats.objects.get(author=self.popular)
+                        .fanned_out)
+        self.assertEqual(self.feed_texts(), ['later post', 'popular post'])
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user', flat=True)),
+            {self.reader.id})
+
+    def test_repair_refills_timelines(self):
+        """repair_counters заполняет ленты, если автор оказался под
+        лимитом рассылки."""
+        self.follow(self.popular)
+        with self.settings(FOLLOW_FANOUT_LIMIT=1, FOLLOW_FANOUT_MARGIN=0):
+            AuthorStats.objects.filter(author=self.popular).update(
+                followers_count=5, fanned_out=False)
+            Post.objects.create(text='popular post', author=self.popular)
+
+            call_command('repair_counters', stdout=io.StringIO())
+
+            self.assertTrue(TimelineEntry.objects.filter(
+                user=self.reader, author=self.popular).exists())
+
+    def test_imported_posts_reach_followers(self):
+        """Посты, загруженные import_posts, попадают в ленты подписчиков."""
+        self.follow(self.author)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/posts.jsonl'
+        with open(path, 'w') as file:
+            json.dump({'type': 'post', 'id': 1, 'author': 'author',
+                       'text': 'imported post'}, file)
+
+        call_command('import_posts', path, stdout=io.StringIO())
+
+        self.assertEqual(self.feed_texts(), ['imported post'])
+
+    def test_backfill_command(self):
+        """Команда backfill_timelines заполняет ленты новых подписок."""
+        Post.objects.create(text='old post', author=self.author)
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.author)])
+        self.assertEqual(self.feed_texts(), [])
+
+        call_command('backfill_timelines', stdout=io.StringIO())
+
+        self.assertEqual(self.feed_texts(), ['old post'])
+
+
+class GroupIndexTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='GroupIndexTest')
+        cls.quiet_group = Group.objects.create(
+            title='quiet', slug='quiet', description='')
+        cls.active_group = Group.objects.create(
+            title='active', slug='active', description='')
+        Post.objects.create(
+            text='latest news', author=cls.user, group=cls.active_group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_group_index(self):
+        """Каталог групп строится одним запросом к статистике."""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('posts:group_index'))
+
+        groups = list(response.context['groups'])
+        self.assertEqual(
+            [stats.group for stats in groups],
+            [self.active_group, self.quiet_group]
+        )
+        self.assertEqual(groups[0].posts_count, 1)
+        self.assertContains(response, 'latest news')
+
+    def test_group_index_follows_new_posts(self):
+        """Новый пост сразу виден в каталоге групп."""
+        url = reverse('posts:group_index')
+        self.client.get(url)
+
+        Post.objects.create(
+            text='wake up', author=self.user, group=self.quiet_group)
+
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['groups'][0].group, self.quiet_group)
+
+    def test_group_index_follows_renamed_author(self):
+        """Новое имя автора последнего поста сразу видно в каталоге."""
+        url = reverse('posts:group_index')
+        self.client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+
+        user.username = 'RenamedAuthor'
+        user.save()
+
+        self.assertEqual(
+            GroupStats.objects.get(group=self.active_group).last_post_author,
+            'RenamedAuthor')
+        response = self.client.get(url)
+        self.assertContains(response, 'RenamedAuthor')
+        self.assertNotContains(response, 'GroupIndexTest')
+
+
+class EstimatedCountTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='EstimatedCountTest')
+        Post.objects.bulk_create(
+            [Post(text=f'post {number}', author=user) for number in range(3)])
+
+    def wait_for_recount(self):
+        estimates._get_executor().submit(lambda: None).result(timeout=5)
+
+    def test_count_is_taken_in_background(self):
+        """Оценка считается в фоне и обновляется по истечении срока."""
+        posts = Post.objects.all()
+        self.assertIsNone(estimates.estimated_count('test', posts))
+        self.wait_for_recount()
+        self.assertEqual(estimates.estimated_count('test', posts), 3)
+
+        Post.objects.first().delete()
+        self.assertEqual(estimates.estimated_count('test', posts), 3)
+
+        with self.settings(COUNT_ESTIMATE_TTL=-1):
+            self.assertEqual(estimates.estimated_count('test', posts), 3)
+            self.wait_for_recount()
+        self.assertEqual(estimates.estimated_count('test', posts), 2)
+
+
+@skipUnless(find_spec('jinja2'), 'Jinja2 is not installed')
+class Jinja2ViewsTest(TestCase):
+    JINJA2_VIEWS = {'posts:index', 'posts:group_posts', 'posts:profile',
+                    'posts:follow_index', 'posts:post_detail',
+                    'posts:post_comments'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='Jinja2ViewsTest', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='jinja group', slug='jinja-group', description='about')
+        for number in range(settings.POSTS_PER_PAGE + 3):
+            cls.post = Post.objects.create(
+                text=f'<b>post {number}</b>', author=cls.author,
+                group=cls.group if number % 2 else None)
+        for number in range(settings.COMMENTS_PER_PAGE + 1):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'comment {number}')
+        cls.reader = User.objects.create_user(username='Jinja2Reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @staticmethod
+    def normalize(response):
+        html = re.sub(r'\s+', ' ', response.content.decode())
+        html = re.sub(r'name="csrfmiddlewaretoken" value="\w+"', '', html)
+        return html.replace('> <', '><').strip()
+
+    def test_pages_match_django_templates(self):
+        """Страницы из шаблонов Jinja2 совпадают с шаблонами Django."""
+        post_id = self.post.id
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': post_id}),
+            reverse('posts:post_comments', kwargs={'post_id': post_id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.client.force_login(self.reader)
+                cache.clear()
+                expected = self.client.get(url)
+                cache.clear()
+                with self.settings(JINJA2_VIEWS=self.JINJA2_VIEWS):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(
+                    self.normalize(response), self.normalize(expected))
+                self.assertTrue(all(
+                    template.name.startswith('django/forms/')
+                    for template in response.templates
+                ))
+
+    def test_engines_do_not_share_cached_pages(self):
+        """Страница, собранная одним движком, не отдаётся вместо другого."""
+        cache.clear()
+        pages = {
+            reverse('posts:index'): 'posts/index.html',
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}):
+                'posts/group_list.html',
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}):
+                'posts/profile.html',
+        }
+        for url, template in pages.items():
+            with self.subTest(url=url):
+                with self.settings(JINJA2_VIEWS=self.JINJA2_VIEWS):
+                    jinja2 = self.client.get(url)
+
+                response = self.client.get(url)
+
+                self.assertTemplateUsed(response, template)
+                self.assertNotEqual(response['ETag'], jinja2['ETag'])
+
+    def test_unlisted_views_use_django_templates(self):
+        """Без настройки и без движка Jinja2 работают шаблоны Django."""
+        url = reverse('posts:index')
+        templates = [settings.TEMPLATES[0]]
+        for options in ({}, {'JINJA2_VIEWS': self.JINJA2_VIEWS,
+                             'TEMPLATES': templates}):
+            with self.subTest(options=options), self.settings(**options):
+                cache.clear()
+                response = self.client.get(url)
+                self.assertTemplateUsed(response, 'posts/index.html')
@@ -0,0 +1,137 @@
+"""Thumbnail generation moved out of the request.
+
+``DeferredThumbnailBackend`` is installed as sorl's ``THUMBNAIL_BACKEND``.
+In a request it only returns thumbnails that already exist; a missing one
+is queued on a background pool and a placeholder is rendered meanwhile.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.templatetags.static import static
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+
+logger = logging.getLogger(__name__)
+
+# Every size the post templates ask for, with the same options.
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PendingThumbnail(DummyImageFile):
+    """Placeholder of the requested size shown until the job is done."""
+
+    @property
+    def url(self):
+        return static('img/placeholder.svg')
+
+
+class DeferredThumbnailBackend(ThumbnailBackend):
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_ or getattr(_local, 'generating', False):
+            return super().get_thumbnail(file_, geometry_string, **options)
+        thumbnail = self._thumbnail_file(file_, geometry_string, dict(options))
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        schedule_thumbnail(file_.name, geometry_string, options)
+        pending = getattr(_local, 'pending', None)
+        if pending is not None:
+            pending.append(thumbnail.name)
+        return PendingThumbnail(geometry_string)
+
+    def _thumbnail_file(self, file_, geometry_string, options) -> ImageFile:
+        """Name the thumbnail the way ``get_thumbnail`` would."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+@contextmanager
+def track_pending():
+    """Collect the names of thumbnails left pending inside the block.
+
+    Used to keep pages and fragments that show placeholders out of the
+    caches.
+    """
+    outer = getattr(_local, 'pending', None)
+    _local.pending = pending = []
+    try:
+        yield pending
+    finally:
+        _local.pending = outer
+        if outer is not None:
+            outer.extend(pending)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def _generate(name: str, geometry_string: str, options: dict) -> None:
+    _local.generating = True
+    try:
+        default.backend.get_thumbnail(
+            ImageFile(name, default.storage), geometry_string, **options)
+    finally:
+        _local.generating = False
+
+
+def _run_job(name: str, geometry_string: str, options: dict) -> None:
+    try:
+        _generate(name, geometry_string, options)
+    except Exception:
+        logger.exception('Thumbnail %s of %s failed', geometry_string, name)
+    finally:
+        connections.close_all()
+
+
+def schedule_thumbnail(name: str, geometry_string: str,
+                       options: dict) -> None:
+    """Queue one thumbnail once the current transaction commits.
+
+    A job already queued for the same thumbnail is not queued again.
+    """
+    key = f'thumbnail-job:{name}:{geometry_string}:{sorted(options.items())}'
+
+    def submit():
+        if cache.add(key, True, settings.THUMBNAIL_JOB_TIMEOUT):
+            _get_executor().submit(_run_job, name, geometry_string, options)
+
+    transaction.on_commit(submit)
+
+
+def schedule_post_thumbnails(post) -> None:
+    """Queue every thumbnail the templates will ask for ``post``."""
+    if not post.image:
+        return
+    for geometry_string, options in POST_THUMBNAILS:
+        schedule_thumbnail(post.image.name, geometry_string, dict(options))
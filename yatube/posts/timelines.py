@@ -0,0 +1,264 @@
+"""Following feeds kept as a timeline table per reader.
+
+A new post is written into the timeline of every follower of its author
+(fan-out on write), so reading the feed is an index range scan instead
+of a query over the posts of every followed author. Fan-out stops once
+an author has more than ``FOLLOW_FANOUT_LIMIT`` followers: the feed
+merges their posts in from the posts table when it is read. It resumes
+only when they drop to ``FOLLOW_FANOUT_MARGIN`` below the limit, so a
+follow toggled at the limit does not switch it back and forth. Resuming
+copies the author's latest posts into every follower's timeline; a
+background thread does that in small writes, since it can be many rows.
+"""
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from operator import attrgetter
+from typing import Iterable, List, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.paginator import Page
+from django.db import connections, transaction
+from django.db.models import Max
+
+from core.writes import run_write
+
+from .bulk import batched
+from .models import AuthorStats, Follow, Post, TimelineEntry, User
+from .utils import MergedKeysetPaginator
+
+logger = logging.getLogger(__name__)
+
+FANOUT_BATCH_SIZE = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _job_key(author_id: int) -> str:
+    return f'resume-fan-out-job:{author_id}'
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='timelines')
+        return _executor
+
+
+def resume_limit() -> int:
+    """Return the follower total at which fan-out resumes."""
+    return settings.FOLLOW_FANOUT_LIMIT - settings.FOLLOW_FANOUT_MARGIN
+
+
+def is_fanned_out(author_id: int) -> bool:
+    return not AuthorStats.objects.filter(
+        author_id=author_id, fanned_out=False).exists()
+
+
+def _copy_posts(author_id: int, posts: Sequence[Tuple[int, object]],
+                follower_ids: Iterable[int]) -> None:
+    """Write ``(id, created)`` of the author's ``posts`` into the
+    timelines of ``follower_ids``."""
+    if not posts:
+        return
+    batch_size = max(FANOUT_BATCH_SIZE // len(posts), 1)
+    for batch in batched(follower_ids, batch_size):
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           author_id=author_id, created=created)
+             for user_id in batch for post_id, created in posts],
+            ignore_conflicts=True
+        )
+
+
+def _follower_ids(author_id: int):
+    return Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+
+
+def fan_out(post: Post) -> None:
+    """Write ``post`` into the timelines of its author's followers."""
+    if is_fanned_out(post.author_id):
+        _copy_posts(post.author_id, [(post.id, post.created)],
+                    _follower_ids(post.author_id).iterator())
+
+
+def fan_out_posts(posts: Iterable[Post]) -> None:
+    """Fan out ``posts`` written in bulk, reading the followers of every
+    author once."""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append((post.id, post.created))
+    on_demand = set(AuthorStats.objects.filter(
+        author_id__in=by_author, fanned_out=False
+    ).values_list('author_id', flat=True))
+    for author_id, author_posts in by_author.items():
+        if author_id not in on_demand:
+            _copy_posts(author_id, author_posts,
+                        _follower_ids(author_id).iterator())
+
+
+def backfill(user_id: int, author_id: int, limit: int) -> int:
+    """Copy the latest ``limit`` posts of the author into the timeline.
+
+    Return how many posts were considered.
+    """
+    if not is_fanned_out(author_id):
+        return 0
+    posts = _latest_posts(author_id, limit)
+    _copy_posts(author_id, posts, [user_id])
+    return len(posts)
+
+
+def _latest_posts(author_id: int, limit: int) -> List[Tuple[int, object]]:
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-created', '-id')
+        .values_list('id', 'created')[:limit]
+    )
+
+
+def update_fan_out(author_id: int) -> None:
+    """Stop fanning out the author's posts over ``FOLLOW_FANOUT_LIMIT``
+    followers, or schedule resuming it at ``resume_limit()``."""
+    stats = AuthorStats.objects.filter(author_id=author_id).values_list(
+        'followers_count', 'fanned_out').first()
+    if stats is None:
+        return
+    followers, fanned_out = stats
+    if fanned_out and followers > settings.FOLLOW_FANOUT_LIMIT:
+        AuthorStats.objects.filter(author_id=author_id).update(
+            fanned_out=False)
+    elif not fanned_out and followers <= resume_limit():
+        transaction.on_commit(partial(schedule_resume, author_id))
+
+
+def schedule_resume(author_id: int) -> None:
+    """Resume the author's fan-out in the background, once at a time."""
+    if cache.add(_job_key(author_id), True, None):
+        _get_executor().submit(_run_resume, author_id)
+
+
+def _run_resume(author_id: int) -> None:
+    try:
+        resume_fan_out(author_id)
+    except Exception:
+        logger.exception('Resuming the fan-out of author %s failed',
+                         author_id)
+    finally:
+        cache.delete(_job_key(author_id))
+        connections.close_all()
+
+
+def _refill_batch(author_id: int, posts: Sequence[Tuple[int, object]],
+                  follower_ids: List[int]) -> None:
+    # Leave out the readers who unfollowed since the ids were read.
+    _copy_posts(author_id, posts, _follower_ids(author_id).filter(
+        user_id__in=follower_ids))
+
+
+def resume_fan_out(author_id: int) -> bool:
+    """Copy the latest posts of the author into the timelines of all
+    their followers, then fan out their posts again.
+
+    Posts written and follows made while the author was over the limit
+    were not fanned out. Every batch of followers is its own write, so
+    other writes are not held up behind the refill. Return whether
+    fan-out resumed; it does not when the author got more followers
+    again meanwhile.
+    """
+    posts = _latest_posts(author_id, settings.FOLLOW_BACKFILL_POSTS)
+    last_post_id = Post.objects.filter(author_id=author_id).aggregate(
+        last=Max('id'))['last'] or 0
+    follows = Follow.objects.filter(author_id=author_id)
+    last_follow_id = follows.aggregate(last=Max('id'))['last'] or 0
+    follower_ids = list(follows.filter(id__lte=last_follow_id)
+                        .values_list('user_id', flat=True))
+    batch_size = max(FANOUT_BATCH_SIZE // max(len(posts), 1), 1)
+    for batch in batched(follower_ids, batch_size):
+        run_write(partial(_refill_batch, author_id, posts, batch))
+
+    def finish() -> bool:
+        resumed = AuthorStats.objects.filter(
+            author_id=author_id, fanned_out=False,
+            followers_count__lte=resume_limit()
+        ).update(fanned_out=True)
+        if not resumed:
+            return False
+        # Catch up with what the refill did not see.
+        later = list(Post.objects.filter(
+            author_id=author_id, id__gt=last_post_id
+        ).values_list('id', 'created'))
+        _copy_posts(author_id, later, _follower_ids(author_id).iterator())
+        for user_id in follows.filter(id__gt=last_follow_id).values_list(
+                'user_id', flat=True):
+            backfill(user_id, author_id, settings.FOLLOW_BACKFILL_POSTS)
+        return True
+
+    return run_write(finish)
+
+
+def sync_fan_out() -> int:
+    """Match the fan-out of every author to their stored follower total.
+
+    Authors fanned out again get their followers' timelines refilled
+    right away. Return how many were refilled.
+    """
+    AuthorStats.objects.filter(
+        fanned_out=True, followers_count__gt=settings.FOLLOW_FANOUT_LIMIT
+    ).update(fanned_out=False)
+    resumed = AuthorStats.objects.filter(
+        fanned_out=False, followers_count__lte=resume_limit()
+    ).values_list('author_id', flat=True)
+    return sum(resume_fan_out(author_id) for author_id in list(resumed))
+
+
+def follow(user: User, author: User) -> None:
+    _, created = Follow.objects.get_or_create(user=user, author=author)
+    if created:
+        backfill(user.id, author.id, settings.FOLLOW_BACKFILL_POSTS)
+
+
+def unfollow(user: User, author: User) -> None:
+    Follow.objects.filter(user=user, author=author).delete()
+
+
+def read_on_demand_authors(user: User) -> List[int]:
+    """Return the followed authors whose posts are not fanned out."""
+    return list(
+        Follow.objects.filter(user=user, author__stats__fanned_out=False)
+        .values_list('author_id', flat=True)
+    )
+
+
+def get_follow_page_obj(request: WSGIRequest, user: User) -> Page:
+    """Return a page of the posts of the authors ``user`` follows."""
+    on_demand = read_on_demand_authors(user)
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
+    if on_demand:
+        # Entries written before the author got this popular give way
+        # to the posts table.
+        entries = entries.exclude(author_id__in=on_demand)
+    sources = [(entries, ('created', 'post_id'), attrgetter('post'))]
+    if on_demand:
+        sources.append((
+            Post.objects.filter(author_id__in=on_demand)
+            .select_related('author', 'group'),
+            ('created', 'id'),
+            lambda post: post,
+        ))
+    paginator = MergedKeysetPaginator(
+        Post.objects.all(), sources, settings.POSTS_PER_PAGE)
+    return paginator.get_page(
+        request.GET.get('page'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
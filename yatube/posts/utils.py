@@ -1,12 +1,272 @@
+import base64
+import binascii
+import heapq
+import itertools
+import json
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.paginator import Paginator, Page
 from django.core.handlers.wsgi import WSGIRequest
 from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
 from django.db.models.query import QuerySet
 
+Source = Tuple[QuerySet, Sequence[str], Callable[[Any], Any]]
+
+
+class KeysetPage(Page):
+    """Page of a keyset paginator.
+
+    Knows whether there are neighbour pages and the cursors leading to
+    them, but not the total number of pages.
+    """
+
+    def __init__(self, object_list, number, paginator,
+                 has_next: bool, has_previous: bool):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Page {self.number or "?"}>'
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def page_window(self) -> range:
+        """Return the numbers of the pages around this one.
+
+        The window reaches ``PAGE_WINDOW`` pages to either side, as far as
+        the estimated total, the known neighbours and ``PAGE_NUMBER_LIMIT``
+        allow. Pages reached by a cursor have no number and no window.
+        """
+        if self.number is None:
+            return range(0)
+        last = self.number
+        if self.has_next():
+            last = max(self.paginator.num_pages, self.number + 1)
+        last = min(last, self.number + settings.PAGE_WINDOW,
+                   settings.PAGE_NUMBER_LIMIT)
+        return range(max(self.number - settings.PAGE_WINDOW, 1), last + 1)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0])
+
+
+class KeysetPaginator(Paginator):
+    """Paginator seeking by ``fields`` instead of COUNT and OFFSET.
+
+    Rows are ordered by ``fields`` descending, newest first. Pages are
+    addressed by opaque cursors: ``after`` returns the rows following
+    the cursor row, ``before`` the rows preceding it. Plain page numbers
+    up to ``PAGE_NUMBER_LIMIT`` are still understood so that old links
+    keep working; they cost an OFFSET scan, which the limit bounds.
+    ``count`` is an estimate of the total used only to size the page
+    window.
+    """
+
+    def __init__(self, object_list: QuerySet, per_page: int,
+                 fields: Sequence[str] = ('created', 'id'),
+                 count: Optional[int] = None):
+        super().__init__(object_list, per_page)
+        self.fields = tuple(fields)
+        self.estimated_count = count
+
+    @property
+    def count(self) -> int:
+        """The estimated total passed in; rows are never counted here."""
+        return self.estimated_count or 0
+
+    def get_page(self, number=None, after: str = None,
+                 before: str = None) -> KeysetPage:
+        if after:
+            key = self.decode_cursor(after)
+            if key is not None:
+                return self._page_after(key)
+        if before:
+            key = self.decode_cursor(before)
+            if key is not None:
+                return self._page_before(key)
+        if number == 'last':
+            return self._last_page()
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        if number > settings.PAGE_NUMBER_LIMIT:
+            raise Http404(f'Pages past {settings.PAGE_NUMBER_LIMIT} are '
+                          f'reached by cursor only.')
+        return self._numbered_page(max(number, 1))
+
+    def encode_cursor(self, obj) -> str:
+        values = []
+        for field in self.fields:
+            value = getattr(obj, field)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+    def decode_cursor(self, cursor: str) -> Optional[tuple]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if len(values) != len(self.fields):
+                return None
+            return tuple(
+                self._to_python(field, value)
+                for field, value in zip(self.fields, values)
+            )
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            return None
+
+    def _to_python(self, field: str, value):
+        try:
+            model_field = self.object_list.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            # An annotation such as a search score, kept as JSON gave it.
+            if not isinstance(value, (int, float)):
+                raise ValueError(value)
+            return value
+        return model_field.to_python(value)
+
+    def _ordered(self, descending: bool = True) -> QuerySet:
+        prefix = '-' if descending else ''
+        return self.object_list.order_by(
+            *(prefix + field for field in self.fields))
+
+    def _seek(self, key: tuple, lookup: str,
+              fields: Sequence[str] = None) -> Q:
+        """Row-value comparison ``fields <lookup> key`` spelled with Q.
+
+        The leading field is also bounded on its own so that the database
+        can turn the condition into an index range scan.
+        """
+        fields = fields or self.fields
+        bound = Q(**{f'{fields[0]}__{lookup}e': key[0]})
+        condition = Q()
+        for position, field in enumerate(fields):
+            equal = {
+                fields[i]: key[i] for i in range(position)
+            }
+            condition |= Q(
+                **equal, **{f'{field}__{lookup}': key[position]})
+        return bound & condition
+
+    def _rows(self, count: int, descending: bool = True, key: tuple = None,
+              offset: int = 0) -> list:
+        """Return ``count`` rows in order, past ``key`` if given."""
+        rows = self._ordered(descending)
+        if key is not None:
+            rows = rows.filter(self._seek(key, 'lt' if descending else 'gt'))
+        return list(rows[offset:offset + count])
+
+    def _page_after(self, key: tuple) -> KeysetPage:
+        rows = self._rows(self.per_page + 1, key=key)
+        if not rows:
+            return self._last_page()
+        return KeysetPage(
+            rows[:self.per_page], None, self,
+            has_next=len(rows) > self.per_page, has_previous=True,
+        )
+
+    def _page_before(self, key: tuple) -> KeysetPage:
+        rows = self._rows(self.per_page + 1, descending=False, key=key)
+        if len(rows) <= self.per_page:
+            return self._numbered_page(1)
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(rows, None, self, has_next=True, has_previous=True)
+
+    def _numbered_page(self, number: int) -> KeysetPage:
+        rows = self._rows(
+            self.per_page + 1, offset=(number - 1) * self.per_page)
+        if not rows and number > 1:
+            return self._last_page()
+        return KeysetPage(
+            rows[:self.per_page], number, self,
+            has_next=len(rows) > self.per_page, has_previous=number > 1,
+        )
+
+    def _last_page(self) -> KeysetPage:
+        rows = self._rows(self.per_page + 1, descending=False)
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(
+            rows, None if has_previous else 1, self,
+            has_next=False, has_previous=has_previous,
+        )
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """Keyset paginator over the union of several sources of posts.
+
+    Every source is a queryset, the fields it is sought and ordered by,
+    and a function turning its rows into page objects. The fields of all
+    sources must hold the same keys as ``fields`` of the page objects,
+    which the cursors are made of. Each page reads at most one page of
+    rows from every source and merges them. ``object_list`` only tells
+    the model the cursors are decoded for.
+    """
+
+    def __init__(self, object_list: QuerySet, sources: Sequence[Source],
+                 per_page: int, fields: Sequence[str] = ('created', 'id')):
+        super().__init__(object_list, per_page, fields)
+        self.sources = sources
+
+    def _key(self, obj) -> tuple:
+        return tuple(getattr(obj, field) for field in self.fields)
+
+    def _rows(self, count: int, descending: bool = True, key: tuple = None,
+              offset: int = 0) -> list:
+        prefix = '-' if descending else ''
+        runs = []
+        for queryset, fields, to_object in self.sources:
+            rows = queryset.order_by(*(prefix + field for field in fields))
+            if key is not None:
+                rows = rows.filter(self._seek(
+                    key, 'lt' if descending else 'gt', fields))
+            runs.append([to_object(row) for row in rows[:offset + count]])
+        merged = heapq.merge(*runs, key=self._key, reverse=descending)
+        return list(itertools.islice(merged, offset, offset + count))
+
+
+def get_posts_page_obj(request: WSGIRequest, posts: QuerySet,
+                       fields: Sequence[str] = ('created', 'id'),
+                       count: Optional[int] = None) -> Page:
+    """Return posts page object.
+
+    ``count`` is the stored or estimated number of ``posts``, if known.
+    """
+    paginator = KeysetPaginator(
+        posts, settings.POSTS_PER_PAGE, fields, count)
+    return paginator.get_page(
+        request.GET.get('page'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def get_comments_page_obj(request: WSGIRequest, comments: QuerySet) -> Page:
+    """Return comments page object, newest first.
 
-def get_posts_page_obj(request: WSGIRequest,
-                       posts: QuerySet) -> Page:
-    """Return posts page object."""
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    Later pages are only reachable through the ``after`` cursor.
+    """
+    paginator = KeysetPaginator(comments, settings.COMMENTS_PER_PAGE)
+    return paginator.get_page(after=request.GET.get('after'))
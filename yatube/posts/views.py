@@ -1,59 +1,191 @@
+from http import HTTPStatus
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import F
+from django.http import (HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
+from django.views.decorators.http import require_POST
+
+from core.replicas import read_from_replica
+from core.template_backends import engine_for
+from core.views import service_unavailable
+from core.writes import WriteTimeout, run_write
 
-from .models import Post, Group, User
-from .forms import CommentForm, PostForm
-from .utils import get_posts_page_obj
+from .models import Follow, Post, Group, GroupStats, User
+from .cache import (cache_anonymous_page, conditional_page, feed_validators,
+                    group_feed, groups_feed, index_feed, post_validators,
+                    profile_feed, render_post_cards)
+from .counters import get_posts_count
+from .estimates import estimated_count
+from .exporting import (CONTENT_TYPES, FORMATS, export_records,
+                        render_records)
+from .forms import CommentForm, PostForm, SearchForm
+from .search import search_posts
+from .thumbnails import schedule_post_thumbnails
+from .timelines import follow, get_follow_page_obj, unfollow
+from .utils import get_comments_page_obj, get_posts_page_obj
 
 
+@read_from_replica
+@conditional_page(feed_validators(index_feed))
+@cache_anonymous_page(index_feed)
 def index(request):
+    using = engine_for(request)
     posts = Post.objects.select_related('author', 'group')
-    page_obj = get_posts_page_obj(request, posts)
+    page_obj = get_posts_page_obj(
+        request, posts,
+        count=estimated_count(index_feed(), Post.objects.all()))
+    render_post_cards(page_obj, using=using,
+                      show_author=True, show_group_link=True)
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/index.html', context)
+    return render(request, 'posts/index.html', context, using=using)
+
+
+@read_from_replica
+@conditional_page(feed_validators(groups_feed))
+@cache_anonymous_page(groups_feed)
+def group_index(request):
+    groups = GroupStats.objects.select_related('group').order_by(
+        F('last_activity').desc(nulls_last=True), 'group__title')
+    context = {
+        'groups': groups,
+    }
+    return render(request, 'posts/group_index.html', context)
 
 
+@read_from_replica
+@conditional_page(feed_validators(group_feed))
+@cache_anonymous_page(group_feed)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_posts_page_obj(request, posts)
+    using = engine_for(request)
+    group = get_object_or_404(
+        Group.objects.select_related('stats'), slug=slug)
+    posts = group.posts.select_related('author')
+    try:
+        posts_count = group.stats.posts_count
+    except GroupStats.DoesNotExist:
+        posts_count = None
+    page_obj = get_posts_page_obj(request, posts, count=posts_count)
+    render_post_cards(page_obj, using=using, show_author=True)
     context = {
         'group': group,
         'page_obj': page_obj,
     }
-    return render(request, 'posts/group_list.html', context)
+    return render(request, 'posts/group_list.html', context, using=using)
 
 
+@read_from_replica
+@conditional_page(feed_validators(profile_feed))
+@cache_anonymous_page(profile_feed)
 def profile(request, username):
-    author = User.objects.get(username=username)
-    posts = author.posts.all()
-    page_obj = get_posts_page_obj(request, posts)
+    using = engine_for(request)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = author.posts.select_related('group')
+    posts_count = get_posts_count(author)
+    page_obj = get_posts_page_obj(request, posts, count=posts_count)
+    render_post_cards(page_obj, using=using, show_group_link=True)
+    following = (
+        request.user.is_authenticated and request.user != author
+        and Follow.objects.filter(user=request.user, author=author).exists()
+    )
     context = {
         'author': author,
-        'posts_count': posts.count(),
+        'posts_count': posts_count,
+        'following': following,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/profile.html', context, using=using)
+
+
+@login_required
+@require_POST
+def profile_follow(request, username):
+    author = get_object_or_404(User, username=username)
+    if author != request.user:
+        try:
+            run_write(lambda: follow(request.user, author))
+        except WriteTimeout:
+            return service_unavailable(request)
+    return redirect('posts:profile', username=username)
+
+
+@login_required
+@require_POST
+def profile_unfollow(request, username):
+    author = get_object_or_404(User, username=username)
+    try:
+        run_write(lambda: unfollow(request.user, author))
+    except WriteTimeout:
+        return service_unavailable(request)
+    return redirect('posts:profile', username=username)
+
+
+@read_from_replica
+@login_required
+def follow_index(request):
+    using = engine_for(request)
+    page_obj = get_follow_page_obj(request, request.user)
+    render_post_cards(page_obj, using=using,
+                      show_author=True, show_group_link=True)
+    context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/profile.html', context)
+    return render(request, 'posts/follow.html', context, using=using)
 
 
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    file_format = request.GET.get('format', 'jsonl')
+    if file_format not in FORMATS:
+        return HttpResponseBadRequest()
+    response = StreamingHttpResponse(
+        render_records(export_records(author), file_format),
+        content_type=CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{file_format}"')
+    return response
+
+
+@read_from_replica
+@conditional_page(post_validators)
 def post_detail(request, post_id):
+    using = engine_for(request)
     post = get_object_or_404(
         Post.objects.select_related(
-            'author',
+            'author__stats',
             'group'
-        ).prefetch_related(
-            'comments'
         ), id=post_id)
-    posts_count = post.author.posts.count()
+    posts_count = get_posts_count(post.author)
     context = {
         'post': post,
         'posts_count': posts_count,
         'comment_form': CommentForm(),
-        'comments': post.comments.all(),
+        'comments': get_comments_page_obj(
+            request, post.comments.select_related('author')),
     }
-    return render(request, 'posts/post_detail.html', context)
+    return render(request, 'posts/post_detail.html', context, using=using)
+
+
+def post_comments(request, post_id):
+    using = engine_for(request)
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page_obj(
+            request, post.comments.select_related('author')),
+    }
+    return render(request, 'includes/posts/comments.html', context,
+                  using=using)
 
 
 @login_required
@@ -65,7 +197,15 @@ def post_create(request):
     if form.is_valid():
         post_obj = form.save(commit=False)
         post_obj.author = request.user
-        post_obj.save()
+
+        def save():
+            post_obj.save()
+            schedule_post_thumbnails(post_obj)
+
+        try:
+            run_write(save)
+        except WriteTimeout:
+            return service_unavailable(request)
         return redirect('posts:profile', username=post_obj.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -83,7 +223,9 @@ def post_edit(request, post_id):
         instance=instance
     )
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
+            schedule_post_thumbnails(instance)
         return redirect(instance)
 
     context = {
@@ -104,5 +246,57 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        try:
+            run_write(comment.save)
+        except WriteTimeout:
+            return service_unavailable(request)
     return redirect(post)
+
+
+def _search_page(request):
+    form = SearchForm(request.GET)
+    posts = Post.objects.select_related('author', 'group')
+    if form.is_valid():
+        if form.cleaned_data['author']:
+            posts = posts.filter(author__username=form.cleaned_data['author'])
+        if form.cleaned_data['group']:
+            posts = posts.filter(group=form.cleaned_data['group'])
+        posts = search_posts(form.cleaned_data['q'], posts)
+    else:
+        posts = search_posts('', posts)
+    page_obj = get_posts_page_obj(request, posts, fields=('score', 'id'))
+    return form, page_obj
+
+
+def search(request):
+    form, page_obj = _search_page(request)
+    render_post_cards(page_obj, show_author=True, show_group_link=True)
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def search_api(request):
+    form, page_obj = _search_page(request)
+    if not form.is_valid():
+        return JsonResponse(
+            {'errors': form.errors}, status=HTTPStatus.BAD_REQUEST)
+    results = [
+        {
+            'id': post.id,
+            'text': post.text,
+            'author': post.author.username,
+            'group': post.group.slug if post.group else None,
+            'created': post.created,
+            'score': post.score,
+            'url': request.build_absolute_uri(post.get_absolute_url()),
+        }
+        for post in page_obj
+    ]
+    return JsonResponse({
+        'results': results,
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor,
+    })
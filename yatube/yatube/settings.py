@@ -1,4 +1,5 @@
 import os
+from importlib.util import find_spec
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,13 +16,15 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 
-    'posts',
+    'posts.apps.PostsConfig',
     'users',
-    'core',
+    'core.apps.CoreConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestProfileMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -34,13 +37,27 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+# Built by ``manage.py flatten_templates``; shadows TEMPLATES_DIR when
+# DEBUG is off. The core.E001/E002 checks fail on a missing or stale build.
+FLAT_TEMPLATES_DIR = os.path.join(BASE_DIR, 'build', 'templates')
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
+        'BACKEND': 'core.template_backends.ProfiledDjangoTemplates',
+        'NAME': 'django',
+        'DIRS': ([TEMPLATES_DIR] if DEBUG
+                 else [FLAT_TEMPLATES_DIR, TEMPLATES_DIR]),
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -52,15 +69,56 @@ TEMPLATES = [
     },
 ]
 
+# Ported feed templates, rendered for the views in JINJA2_VIEWS when
+# Jinja2 is installed.
+JINJA2_DIR = os.path.join(BASE_DIR, 'jinja2')
+if find_spec('jinja2') is not None:
+    TEMPLATES.append({
+        'BACKEND': 'core.jinja.ProfiledJinja2',
+        'NAME': 'jinja2',
+        'DIRS': [JINJA2_DIR],
+        'OPTIONS': {
+            'environment': 'core.jinja.environment',
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'core.context_processors.year.year',
+            ],
+        },
+    })
+
+# URL names of the views rendered with Jinja2, e.g. "posts:index".
+JINJA2_VIEWS = set(
+    filter(None, os.environ.get('YATUBE_JINJA2_VIEWS', '').split(',')))
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Feed views read from this alias when YATUBE_REPLICA_DB names its file;
+# ``manage.py replicate_db`` keeps it in sync locally.
+REPLICA_DATABASE = None
+if os.environ.get('YATUBE_REPLICA_DB'):
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['YATUBE_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.PrimaryReplicaRouter']
+
+REPLICA_PIN_COOKIE = 'primary_pin'
+
+REPLICA_PIN_SECONDS = 10
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -87,11 +145,110 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
+# collectstatic writes hashed names, a manifest and .gz/.br siblings;
+# they are served by core.static.serve_static.
+if not DEBUG:
+    STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+# Browser cache lifetime of hashed static files, s.
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+
 POSTS_PER_PAGE = 10
 
+COMMENTS_PER_PAGE = 20
+
+# Numbered page links shown on either side of the current page.
+PAGE_WINDOW = 2
+
+# Deepest page reachable by number, which bounds the OFFSET of a numbered
+# page; deeper pages are reached by cursor only.
+PAGE_NUMBER_LIMIT = 100
+
+COUNT_ESTIMATE_TTL = 60 * 5
+
+GROUP_PREVIEW_LENGTH = 200
+
+# Posts of authors with more followers are merged into the following
+# feeds on read instead of being copied into every timeline. Copying
+# resumes once the author is FOLLOW_FANOUT_MARGIN below the limit.
+FOLLOW_FANOUT_LIMIT = 1000
+FOLLOW_FANOUT_MARGIN = 100
+FOLLOW_BACKFILL_POSTS = 100
+
+EXPORT_CHUNK_SIZE = 2000
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+FILE_UPLOAD_HANDLERS = ['posts.images.LimitedUploadHandler']
+
+POST_IMAGE_MAX_UPLOAD_SIZE = 25 * 2 ** 20
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+POST_IMAGE_MAX_SIZE = 1920
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 82
+POST_IMAGE_VARIANT_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+POST_IMAGE_VARIANT_WIDTHS = (320, 480, 640, 960)
+POST_IMAGE_VARIANT_ASPECT = (960, 339)
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.DeferredThumbnailBackend'
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_JOB_TIMEOUT = 60 * 10
+
+REQUEST_PROFILE_SLOWEST = 3
+
+WRITE_COALESCING = True
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_WAIT = 0.002
+WRITE_TIMEOUT = 10
+# Seconds a client is asked to wait before resending a dropped write.
+WRITE_RETRY_AFTER = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'require_debug_true': {
+            '()': 'django.utils.log.RequireDebugTrue',
+        },
+    },
+    'handlers': {
+        'console': {
+            'level': 'INFO',
+            'filters': ['require_debug_true'],
+            'class': 'logging.StreamHandler',
+        },
+        # The per-request profile lines are wanted in production too.
+        'requests': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Clients that get the Server-Timing header; staff get it as well.
+INTERNAL_IPS = ['127.0.0.1', '::1']
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -109,3 +266,9 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# How core.media.serve_media hands files to the front server: None sends
+# them from Django, 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect'
+# (nginx, with an internal location aliasing MEDIA_ROOT at
+# MEDIA_ACCEL_PREFIX).
+MEDIA_SENDFILE = os.environ.get('YATUBE_MEDIA_SENDFILE') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
@@ -1,7 +1,17 @@
 import os
 
+from django.core import checks
+from django.core.management.base import SystemCheckError
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# manage.py runs the checks for its own commands, a WSGI server does not;
+# a stale template build must not be served silently.
+errors = [message
+          for message in checks.run_checks(tags=[checks.Tags.templates])
+          if message.is_serious()]
+if errors:
+    raise SystemCheckError('\n'.join(map(str, errors)))